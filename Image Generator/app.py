@@ -13,22 +13,38 @@ app = Flask(__name__)
 from PIL import Image
 import torch
 from diffusers import StableDiffusionPipeline
+import dnnlib
 
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "dreamshaper_8.safetensors")
+MODEL_NAME = "dreamshaper_8"
 pipe = None
 
+def resolve_model_file():
+    """Verify MODEL_PATH through the shared model store and return it.
+    The file is hashed once and then only stat'ed on later starts.  Where possible it becomes a
+    hard link to the stored blob (and is restored from the store if deleted); on a volume without
+    hard links it is recorded in place rather than copied.  The store dedupes and verifies the file
+    on disk only: from_single_file() converts the weights to torch_dtype and moves them to the
+    device, so every process still holds its own copy of the weights in memory."""
+    store = dnnlib.util.get_model_store()
+    if os.path.isfile(MODEL_PATH):
+        store.add_file(MODEL_PATH, name=MODEL_NAME, copy=False)
+    store.export(MODEL_NAME, MODEL_PATH)
+    return MODEL_PATH
+
 def load_model():
     global pipe
     if pipe is not None:
         return
     print("Loading DreamShaper Stable Diffusion model...")
     try:
+        model_file = resolve_model_file()
         device = "cuda" if torch.cuda.is_available() else "cpu"
         if device == "cuda":
-            pipe = StableDiffusionPipeline.from_single_file(MODEL_PATH, torch_dtype=torch.float16)
+            pipe = StableDiffusionPipeline.from_single_file(model_file, torch_dtype=torch.float16)
         else:
-            pipe = StableDiffusionPipeline.from_single_file(MODEL_PATH, torch_dtype=torch.float32)
+            pipe = StableDiffusionPipeline.from_single_file(model_file, torch_dtype=torch.float32)
         pipe = pipe.to(device)
         print(f"DreamShaper model loaded successfully on {device}!")
     except Exception as e:
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for dnnlib.util against local fixtures.
+
+Runs offline: downloads are served by a local multi-threaded HTTP server
+that supports Range requests and ETags, and can drop connections or
+throttle bandwidth per connection to simulate real links.
+
+Usage:
+    python bench_dnnlib.py              # run every benchmark
+    python bench_dnnlib.py download     # run one benchmark
+"""
+
+import hashlib
+import numpy as np
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dnnlib import util
+
+
+# Local HTTP server
+# ------------------------------------------------------------------------------------------
+
+class RangeServer(object):
+    """Serve files from `root` on 127.0.0.1 with Range and ETag support.
+
+    Args:
+        root: Directory to serve
+        drop_after: Close the connection after this many bytes, for the first
+            `drop_count` responses (simulates interrupted downloads)
+        rate: Per-connection bandwidth limit in bytes/second (None = unlimited)
+        ranges: Whether to honour Range requests
+    """
+
+    def __init__(self, root, drop_after=None, drop_count=0, rate=None, ranges=True):
+        self.root = root
+        self.drop_after = drop_after
+        self.drop_count = drop_count
+        self.rate = rate
+        self.ranges = ranges
+        self.bytes_sent = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    def url(self, name):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d/%s" % (host, port, name)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(head=True)
+
+            def do_GET(self, head=False):
+                path = os.path.join(server.root, os.path.basename(self.path))
+                if not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                etag = '"%x-%x"' % (size, int(os.path.getmtime(path)))
+                with server.lock:
+                    server.requests += 1
+                    drop = server.drop_count > 0 and not head
+                    if drop:
+                        server.drop_count -= 1
+
+                start, end = 0, size - 1
+                match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                if server.ranges and match and (if_range is None or if_range == etag):
+                    start = int(match[1])
+                    end = min(int(match[2]), size - 1) if match[2] else size - 1
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header("Content-Range", "bytes */%d" % size)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+                else:
+                    self.send_response(200)
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                if head:
+                    return
+
+                limit = end - start + 1
+                if drop and server.drop_after is not None:
+                    limit = min(limit, server.drop_after)
+                began = time.time()
+                sent = 0
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    while sent < limit:
+                        chunk = f.read(min(1 << 16, limit - sent))
+                        if not chunk:
+                            break
+                        try:
+                            self.wfile.write(chunk)
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+                        sent += len(chunk)
+                        with server.lock:
+                            server.bytes_sent += len(chunk)
+                        if server.rate:
+                            ahead = sent / server.rate - (time.time() - began)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                if sent < end - start + 1:
+                    self.close_connection = True
+
+        return Handler
+
+
+def make_file(path, size):
+    """Write `size` pseudo-random bytes and return their SHA-256."""
+    digest = hashlib.sha256()
+    block = os.urandom(1 << 20)
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            chunk = block[:min(len(block), size - written)]
+            f.write(chunk)
+            digest.update(chunk)
+            written += len(chunk)
+    return digest.hexdigest()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _in_child(func, *args):
+    """Run func(*args) in a fresh process; return (result, peak RSS in bytes)."""
+    def target(queue):
+        result = func(*args)
+        queue.put((result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# Benchmarks
+# ------------------------------------------------------------------------------------------
+
+def bench_download(size=256 << 20):
+    """Streaming download with two interrupted connections and Range resume."""
+    print("\nopen_url: streaming + resume (%s, 2 dropped connections)" % util.format_size(size))
+    with tempfile.TemporaryDirectory() as root:
+        served = os.path.join(root, "served")
+        os.makedirs(served)
+        expected = make_file(os.path.join(served, "model.bin"), size)
+
+        with RangeServer(served, drop_after=size // 3, drop_count=2) as server:
+            cache_dir = os.path.join(root, "cache")
+            start = time.time()
+            filename, peak_rss = _in_child(util.open_url, server.url("model.bin"), cache_dir, 10, False, True)
+            elapsed = time.time() - start
+
+            print("  time:            %.2f s (%s/s)" % (elapsed, util.format_size(size / elapsed)))
+            print("  bytes served:    %s (%.2fx file size)" % (util.format_size(server.bytes_sent), server.bytes_sent / size))
+            print("  peak child RSS:  %s" % util.format_size(peak_rss))
+            print("  content ok:      %s" % (sha256_file(filename) == expected))
+
+
+def bench_parallel_download(size=128 << 20, rate=16 << 20, num_connections=8):
+    """Single stream vs. parallel ranged download from a throttled server."""
+    print("\nopen_url: parallel ranges (%s, %s/s per connection)" % (util.format_size(size), util.format_size(rate)))
+    with tempfile.TemporaryDirectory() as root:
+        served = os.path.join(root, "served")
+        os.makedirs(served)
+        expected = make_file(os.path.join(served, "model.bin"), size)
+
+        cases = [
+            ("1 connection", dict(), 1),
+            ("%d connections" % num_connections, dict(), num_connections),
+            ("%d conns, 3 drops" % num_connections, dict(drop_after=size // 20, drop_count=3), num_connections),
+            ("no Range support", dict(ranges=False), num_connections),
+        ]
+        for label, server_args, connections in cases:
+            with RangeServer(served, rate=rate, **server_args) as server:
+                cache_dir = tempfile.mkdtemp(dir=root)
+                start = time.time()
+                filename = util.open_url(server.url("model.bin"), cache_dir=cache_dir, verbose=False,
+                                         return_filename=True, num_connections=connections)
+                elapsed = time.time() - start
+                ok = sha256_file(filename) == expected
+                print("  %-20s %6.2f s  %9s/s  %3d requests  content ok: %s" % (
+                    label, elapsed, util.format_size(size / elapsed), server.requests, ok))
+
+
+def _fetch(url, cache_dir):
+    return util.open_url(url, cache_dir=cache_dir, verbose=False, return_filename=True)
+
+
+def bench_cache(num_files=2000, num_workers=8):
+    """Indexed lookups vs. directory globbing, LRU eviction and concurrent fetches."""
+    import glob
+    import concurrent.futures
+
+    print("\nDownloadCache: %d cached files" % num_files)
+    with tempfile.TemporaryDirectory() as root:
+        cache_dir = os.path.join(root, "cache")
+        os.makedirs(cache_dir)
+        for i in range(num_files):
+            url_md5 = hashlib.md5(("https://example.com/%d" % i).encode()).hexdigest()
+            with open(os.path.join(cache_dir, "%s_file%d.bin" % (url_md5, i)), "wb") as f:
+                f.write(b"x" * 1024)
+
+        urls = ["https://example.com/%d" % i for i in range(0, num_files, 7)]
+        start = time.perf_counter()
+        for url in urls:
+            glob.glob(os.path.join(cache_dir, hashlib.md5(url.encode()).hexdigest() + "_*"))
+        glob_us = (time.perf_counter() - start) / len(urls) * 1e6
+
+        _fetch(urls[0], cache_dir) # builds the index from the existing files
+        start = time.perf_counter()
+        for url in urls:
+            _fetch(url, cache_dir)
+        index_us = (time.perf_counter() - start) / len(urls) * 1e6
+        print("  lookup: glob %.1f us, index %.1f us" % (glob_us, index_us))
+
+        served = os.path.join(root, "served")
+        os.makedirs(served)
+        for i in range(4):
+            make_file(os.path.join(served, "f%d.bin" % i), 4 << 20)
+        with RangeServer(served, rate=32 << 20) as server:
+            lru_dir = os.path.join(root, "lru")
+            util.set_cache_max_bytes(10 << 20)
+            try:
+                for i in range(4):
+                    _fetch(server.url("f%d.bin" % i), lru_dir)
+                cached = util.get_download_cache(lru_dir)
+                print("  LRU: 4 x 4 MB into a 10 MB budget -> %d files, %s" % (len(cached.entries), util.format_size(cached.total_bytes())))
+            finally:
+                util.set_cache_max_bytes(None)
+
+            shared_dir = os.path.join(root, "shared")
+            requests_before = server.requests
+            with concurrent.futures.ProcessPoolExecutor(num_workers) as pool:
+                results = list(pool.map(_fetch, [server.url("f0.bin")] * num_workers, [shared_dir] * num_workers))
+            print("  %d processes fetching one URL: %d download(s), %d distinct file(s)" % (
+                num_workers, server.requests - requests_before, len(set(results))))
+
+
+def _log_lines(num_lines, **logger_args):
+    """Print num_lines through a Logger with stdout sent to /dev/null; return lines/sec."""
+    with tempfile.TemporaryDirectory() as root, open(os.devnull, "w") as devnull:
+        real_stdout, real_stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = devnull
+        try:
+            logger = util.Logger(os.path.join(root, "log.txt"), **logger_args)
+            start = time.perf_counter()
+            for i in range(num_lines):
+                print("tick %d: loss 0.1234 lr 0.0025" % i)
+            logger.close()
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout, sys.stderr = real_stdout, real_stderr
+    return num_lines / elapsed
+
+
+def bench_logger(num_lines=200000):
+    """Logger throughput: flush on every write vs. buffered background flushing."""
+    print("\nLogger: %d printed lines to a file and /dev/null" % num_lines)
+    cases = [
+        ("flush every write", dict()),
+        ("buffered", dict(buffered=True)),
+        ("buffered, JSON lines", dict(buffered=True, json_lines=True)),
+    ]
+    for label, logger_args in cases:
+        print("  %-22s %10.0f lines/s" % (label, _log_lines(num_lines, **logger_args)))
+
+
+def _per_call_ns(func, *args, repeat=100000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def _missing(resolve, name):
+    try:
+        resolve(name)
+    except (ImportError, AttributeError):
+        pass
+
+
+def bench_resolve(repeat=100000):
+    """Repeat name resolution with the memo cache vs. the full module search."""
+    import concurrent.futures
+
+    print("\nget_obj_by_name: %d repeated lookups (ns per call)" % repeat)
+    names = {"dnnlib.util.EasyDict": util.EasyDict, "numpy.linalg.norm": np.linalg.norm}
+    table = dict(names)
+    lookup = lambda name: table[name] # the same call overhead as get_obj_by_name
+    for name, expected in names.items():
+        search_ns = _per_call_ns(util._search_module_from_obj_name, name, repeat=repeat // 10)
+        cached_ns = _per_call_ns(util.get_obj_by_name, name, repeat=repeat)
+        dict_ns = _per_call_ns(lookup, name, repeat=repeat)
+        assert util.get_obj_by_name(name) is expected
+        print("  %-22s search %6.0f, cached %5.0f, dict lookup %4.0f" % (name, search_ns, cached_ns, dict_ns))
+
+    missing = "dnnlib.util.NoSuchClass"
+    search_ns = _per_call_ns(_missing, util._search_module_from_obj_name, missing, repeat=repeat // 10)
+    cached_ns = _per_call_ns(_missing, util.get_obj_by_name, missing, repeat=repeat)
+    print("  %-22s search %6.0f, cached %5.0f (raises)" % ("missing name", search_ns, cached_ns))
+    construct_ns = _per_call_ns(lambda: util.construct_class_by_name(class_name="dnnlib.util.EasyDict", a=1), repeat=repeat)
+    print("  construct_class_by_name: %.0f" % construct_ns)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = set(pool.map(util.get_obj_by_name, ["dnnlib.util.EasyDict"] * 10000))
+    print("  8 threads, 10000 lookups: %d distinct result(s)" % len(results))
+
+
+def _list_dir_original(dir_path, ignores):
+    """The os.walk() + per-pattern fnmatch listing that list_dir_recursively_with_ignore replaced."""
+    import fnmatch
+
+    result = []
+    for root, dirs, files in os.walk(dir_path, topdown=True):
+        for ignore_ in ignores:
+            for d in [d for d in dirs if fnmatch.fnmatch(d, ignore_)]:
+                dirs.remove(d)
+            files = [f for f in files if not fnmatch.fnmatch(f, ignore_)]
+        absolute_paths = [os.path.join(root, f) for f in files]
+        result += zip(absolute_paths, [os.path.relpath(p, dir_path) for p in absolute_paths])
+    return result
+
+
+def _copy_files_original(files):
+    """The serial exists() + makedirs() + copyfile() loop that copy_files_and_create_dirs replaced."""
+    import shutil
+
+    for src, dst in files:
+        if not os.path.exists(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        shutil.copyfile(src, dst)
+
+
+def make_tree(root, num_files, files_per_dir=50, file_size=4096):
+    """Write a nested source tree with some __pycache__ directories and *.pyc files to ignore."""
+    payload = os.urandom(file_size)
+    for i in range(num_files):
+        d = os.path.join(root, "pkg%d" % (i // (files_per_dir * 10)), "mod%d" % (i // files_per_dir % 10))
+        if i % files_per_dir == 0:
+            os.makedirs(os.path.join(d, "__pycache__"), exist_ok=True)
+        name = "file%d.%s" % (i, "pyc" if i % 10 == 0 else "py")
+        with open(os.path.join(d, "__pycache__" if i % 25 == 0 else "", name), "wb") as f:
+            f.write(payload)
+
+
+def bench_snapshot(num_files=40000):
+    """Listing and copying a large source tree, as done for run directory snapshots."""
+    ignores = ["__pycache__", "*.pyc", "*.pyd", "*.so", ".git", ".ipynb_checkpoints", "*.egg-info", "results"]
+    print("\nlist_dir_recursively_with_ignore / copy_files_and_create_dirs: %d files, %d ignore patterns" % (num_files, len(ignores)))
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "src")
+        make_tree(src, num_files)
+
+        start = time.perf_counter()
+        expected = _list_dir_original(src, ignores)
+        original_s = time.perf_counter() - start
+        start = time.perf_counter()
+        listed = util.list_dir_recursively_with_ignore(src, ignores)
+        listed_s = time.perf_counter() - start
+        print("  listing: original %6.3f s, compiled matcher %6.3f s  (%d files, same result: %s)" % (
+            original_s, listed_s, len(listed), sorted(listed) == sorted(expected)))
+
+        def targets(name):
+            return [(a, os.path.join(root, name, r)) for a, r in listed]
+
+        os.sync() # keep writeback of one case from slowing down the next
+        start = time.perf_counter()
+        _copy_files_original(targets("original"))
+        print("  original serial loop  %6.3f s" % (time.perf_counter() - start))
+        cases = [("copy", None), ("copy", 8), ("hardlink", None), ("reflink", None)]
+        for mode, num_workers in cases:
+            files = targets("%s%s" % (mode, num_workers))
+            os.sync()
+            start = time.perf_counter()
+            copied = util.copy_files_and_create_dirs(files, mode=mode, num_workers=num_workers, skip_unchanged=True)
+            first_s = time.perf_counter() - start
+            start = time.perf_counter()
+            recopied = util.copy_files_and_create_dirs(files, mode=mode, num_workers=num_workers, skip_unchanged=True)
+            again_s = time.perf_counter() - start
+            label = "%s, workers=%d" % (mode, num_workers or os.cpu_count() or 1)
+            print("  %-20s %6.3f s (%d files), unchanged rerun %6.3f s (%d copied)" % (
+                label, first_s, copied, again_s, recopied))
+
+
+def make_safetensors(path, total_bytes, tensor_bytes=16 << 20, seed=0):
+    """Write a .safetensors file of random float16 tensors."""
+    import json
+
+    rng = np.random.default_rng(seed)
+    count = max(1, total_bytes // tensor_bytes)
+    header, offset = {"__metadata__": {"format": "pt"}}, 0
+    for i in range(count):
+        header["layer%d.weight" % i] = {"dtype": "F16", "shape": [tensor_bytes // 2048, 1024], "data_offsets": [offset, offset + tensor_bytes]}
+        offset += tensor_bytes
+    header_bytes = json.dumps(header).encode()
+    with open(path, "wb") as f:
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for i in range(count):
+            f.write(rng.standard_normal(tensor_bytes // 2, dtype=np.float32).astype(np.float16).tobytes())
+
+
+def _private_bytes():
+    """Bytes of this process's memory not shared with any other process (Linux)."""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    return sum(int(fields[key].split()[0]) * 1024 for key in ("Private_Clean", "Private_Dirty"))
+
+
+def _load_and_touch(path, use_mmap, barrier):
+    before = _private_bytes()
+    if use_mmap:
+        tensors = util.mmap_safetensors(path)
+    else:
+        with open(path, "rb") as f:
+            header, data_start = util.read_safetensors_header(f)
+            data = f.read()
+        tensors = {name: np.frombuffer(data, np.float16, int(np.prod(info["shape"])), info["data_offsets"][0]) for name, info in header.items() if name != "__metadata__"}
+    checksum = sum(float(t[::64].sum(dtype=np.float64)) for t in tensors.values()) # touches every page
+    barrier.wait() # all processes hold their tensors at the same time
+    return checksum, _private_bytes() - before
+
+
+def _load_in_child(args):
+    path, use_mmap, barrier = args
+    return _load_and_touch(path, use_mmap, barrier)
+
+
+def bench_store(size=256 << 20, num_processes=4):
+    """Content-addressed model store: dedup, verification caching and shared mmap loading."""
+    print("\nModelStore: %s safetensors file" % util.format_size(size))
+    with tempfile.TemporaryDirectory() as root:
+        served = os.path.join(root, "served")
+        os.makedirs(served)
+        model = os.path.join(served, "model.safetensors")
+        make_safetensors(model, size)
+        os.link(model, os.path.join(served, "mirror.safetensors"))
+
+        store = util.ModelStore(os.path.join(root, "models"))
+        with RangeServer(served) as server:
+            paths = [store.fetch(server.url(name), cache_dir=os.path.join(root, "downloads"), verbose=False)
+                     for name in ("model.safetensors", "mirror.safetensors")]
+        blob = paths[0]
+        blobs = [entry for _, _, files in os.walk(store.blob_dir) for entry in files]
+        print("  2 URLs, same content: %d blob(s), %d links to it" % (len(blobs), os.stat(blob).st_nlink))
+
+        digest = os.path.basename(blob)
+        os.remove(store.verified_file)
+        store = util.ModelStore(store.root)
+        start = time.perf_counter()
+        store.get(digest)
+        first_ms = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        util.ModelStore(store.root).get(digest)
+        again_ms = (time.perf_counter() - start) * 1e3
+        print("  verify: first use %.1f ms, cached (new instance) %.2f ms" % (first_ms, again_ms))
+
+        start = time.perf_counter()
+        tensors = store.load_safetensors(digest)
+        print("  mmap_safetensors: %d tensors in %.2f ms" % (len(tensors), (time.perf_counter() - start) * 1e3))
+
+        if not os.path.exists("/proc/self/smaps_rollup"):
+            return
+        for use_mmap in (False, True):
+            barrier = multiprocessing.Manager().Barrier(num_processes)
+            with multiprocessing.Pool(num_processes) as pool:
+                results = pool.map(_load_in_child, [(blob, use_mmap, barrier)] * num_processes)
+            private = sum(r[1] for r in results)
+            print("  %d processes, %-11s private memory for tensors %9s in total, same data: %s" % (
+                num_processes, "mmap:" if use_mmap else "read():", util.format_size(private), len(set(r[0] for r in results)) == 1))
+
+
+BENCHMARKS = {
+    "download": bench_download,
+    "parallel": bench_parallel_download,
+    "cache": bench_cache,
+    "logger": bench_logger,
+    "resolve": bench_resolve,
+    "snapshot": bench_snapshot,
+    "store": bench_store,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    print("dnnlib.util benchmarks")
+    print("=" * 50)
+    for name in names:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
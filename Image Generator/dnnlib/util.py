@@ -8,6 +8,9 @@
 
 """Miscellaneous utility classes and functions."""
 
+import atexit
+import collections
+import concurrent.futures
 import ctypes
 import fnmatch
 import importlib
@@ -23,11 +26,13 @@ import re
 import requests
 import html
 import hashlib
-import glob
+import json
 import tempfile
+import threading
+import time
 import urllib
 import urllib.request
-import uuid
+import weakref
 
 from distutils.util import strtobool
 from typing import Any, List, Tuple, Union
@@ -54,20 +59,48 @@ class EasyDict(dict):
 
 
 class Logger(object):
-    """Redirect stderr to stdout, optionally print stdout to a file, and optionally force flushing on both stdout and the file."""
-
-    def __init__(self, file_name: str = None, file_mode: str = "w", should_flush: bool = True):
+    """Redirect stderr to stdout, optionally print stdout to a file, and optionally force flushing on both stdout and the file.
+
+    With buffered=True, writes are appended to an in-memory buffer that a background
+    thread flushes every flush_interval seconds or once flush_bytes have accumulated.
+    flush() then only wakes that thread; text written to stderr, close() and
+    interpreter exit flush synchronously.  A forked child has no flush thread and may
+    exit without running atexit handlers, so there the logger writes through instead.
+    With json_lines=True, the file receives one JSON object per line with the time it
+    was written and its stream."""
+
+    def __init__(self, file_name: str = None, file_mode: str = "w", should_flush: bool = True, buffered: bool = False,
+                 flush_interval: float = 1.0, flush_bytes: int = 1 << 16, json_lines: bool = False):
         self.file = None
 
         if file_name is not None:
             self.file = open(file_name, file_mode)
 
         self.should_flush = should_flush
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.json_lines = json_lines
         self.stdout = sys.stdout
         self.stderr = sys.stderr
 
+        self._buffer = collections.deque() # (time, stream, text)
+        self._buffer_bytes = 0
+        self._buffer_lock = threading.Lock()
+        self._io_lock = threading.RLock() # serializes draining so output keeps its order
+        self._partial_line = None # (time, stream, text) of an unfinished JSON line
+        self._flush_thread = None
+
+        if buffered:
+            self._wake = threading.Event()
+            self._stopping = False
+            self._flush_thread = threading.Thread(target=self._flush_loop, name="LoggerFlush", daemon=True)
+            self._flush_thread.start()
+            atexit.register(self.close)
+            _buffered_loggers.add(self)
+
         sys.stdout = self
-        sys.stderr = self
+        sys.stderr = _LoggerErrorStream(self) if (buffered or json_lines) else self
 
     def __enter__(self) -> "Logger":
         return self
@@ -75,23 +108,91 @@ class Logger(object):
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
         self.close()
 
-    def write(self, text: Union[str, bytes]) -> None:
+    def write(self, text: Union[str, bytes], stream: str = "stdout") -> None:
         """Write text to stdout (and a file) and optionally flush."""
         if isinstance(text, bytes):
             text = text.decode()
         if len(text) == 0: # workaround for a bug in VSCode debugger: sys.stdout.write(''); sys.stdout.flush() => crash
             return
 
+        if self.buffered:
+            with self._buffer_lock:
+                self._buffer.append((time.time(), stream, text))
+                self._buffer_bytes += len(text)
+                pending = self._buffer_bytes
+            if stream == "stderr" or pending >= 4 * self.flush_bytes:
+                self._drain() # errors go out immediately; writers outpacing the thread block here
+            elif pending >= self.flush_bytes:
+                self._wake.set()
+            return
+
         if self.file is not None:
-            self.file.write(text)
+            self.file.write(self._format_for_file([(time.time(), stream, text)]) if self.json_lines else text)
 
         self.stdout.write(text)
 
         if self.should_flush:
             self.flush()
 
+    def _format_for_file(self, chunks: List[Tuple[float, str, str]]) -> str:
+        """Assemble written chunks into JSON lines, keeping an unfinished line for later."""
+        records = []
+        for chunk in chunks:
+            if self._partial_line is not None:
+                if self._partial_line[1] == chunk[1]:
+                    chunk = (self._partial_line[0], chunk[1], self._partial_line[2] + chunk[2])
+                else:
+                    records.append(self._partial_line)
+                self._partial_line = None
+            lines = chunk[2].split("\n")
+            for line in lines[:-1]:
+                records.append((chunk[0], chunk[1], line))
+            if lines[-1]:
+                self._partial_line = (chunk[0], chunk[1], lines[-1])
+        return "".join(map(self._json_line, records))
+
+    @staticmethod
+    def _json_line(record: Tuple[float, str, str]) -> str:
+        return '{"time": %.6f, "stream": "%s", "text": %s}\n' % (record[0], record[1], json.dumps(record[2]))
+
+    def _drain(self) -> None:
+        """Write out and flush everything buffered so far."""
+        with self._io_lock:
+            with self._buffer_lock:
+                chunks = list(self._buffer)
+                self._buffer.clear()
+                self._buffer_bytes = 0
+            if chunks:
+                text = "".join(chunk[2] for chunk in chunks)
+                if self.file is not None:
+                    self.file.write(self._format_for_file(chunks) if self.json_lines else text)
+                self.stdout.write(text)
+            if self.file is not None:
+                self.file.flush()
+            self.stdout.flush()
+
+    def _flush_loop(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+
+    def _reset_after_fork(self) -> None:
+        """In a forked child, drop the parent's pending text (the parent writes it) and write through."""
+        self._buffer_lock = threading.Lock() # may have been held by another thread at fork time
+        self._io_lock = threading.RLock()
+        self._buffer.clear()
+        self._buffer_bytes = 0
+        self._partial_line = None
+        self._flush_thread = None
+        self.buffered = False
+
     def flush(self) -> None:
-        """Flush written text to both stdout and a file, if open."""
+        """Flush written text to both stdout and a file, if open. Buffered loggers flush in the background."""
+        if self.buffered:
+            self._wake.set()
+            return
+
         if self.file is not None:
             self.file.flush()
 
@@ -99,12 +200,26 @@ class Logger(object):
 
     def close(self) -> None:
         """Flush, close possible files, and remove stdout/stderr mirroring."""
-        self.flush()
+        if self._flush_thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+            atexit.unregister(self.close)
+        if self.buffered:
+            self._drain()
+            self.buffered = False # later writes through saved references go straight out, as they used to
+        else:
+            self.flush()
+
+        if self.json_lines and self._partial_line is not None and self.file is not None:
+            self.file.write(self._json_line(self._partial_line))
+            self._partial_line = None
 
         # if using multiple loggers, prevent closing in wrong order
         if sys.stdout is self:
             sys.stdout = self.stdout
-        if sys.stderr is self:
+        if sys.stderr is self or getattr(sys.stderr, "logger", None) is self:
             sys.stderr = self.stderr
 
         if self.file is not None:
@@ -112,6 +227,30 @@ class Logger(object):
             self.file = None
 
 
+_buffered_loggers = weakref.WeakSet()
+
+def _reset_loggers_after_fork() -> None:
+    for logger in list(_buffered_loggers):
+        logger._reset_after_fork()
+    _buffered_loggers.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_loggers_after_fork)
+
+
+class _LoggerErrorStream(object):
+    """Stand-in for sys.stderr that tags text written through a Logger as stderr."""
+
+    def __init__(self, logger: Logger):
+        self.logger = logger
+
+    def write(self, text: Union[str, bytes]) -> None:
+        self.logger.write(text, stream="stderr")
+
+    def flush(self) -> None:
+        self.logger.flush()
+
+
 # Cache directories
 # ------------------------------------------------------------------------------------------
 
@@ -150,6 +289,15 @@ def format_time(seconds: Union[int, float]) -> str:
         return "{0}d {1:02}h {2:02}m".format(s // (24 * 60 * 60), (s // (60 * 60)) % 24, (s // 60) % 60)
 
 
+def format_size(num_bytes: Union[int, float]) -> str:
+    """Convert a byte count to a human readable string."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024:
+            return "{0:.1f} {1}".format(num_bytes, unit)
+        num_bytes /= 1024
+    return "{0:.1f} TB".format(num_bytes)
+
+
 def ask_yes_no(question: str) -> bool:
     """Ask the user the question until the user inputs a valid answer."""
     while True:
@@ -219,9 +367,8 @@ def is_pickleable(obj: Any) -> bool:
 # Functionality to import modules/objects by name, and call functions by name
 # ------------------------------------------------------------------------------------------
 
-def get_module_from_obj_name(obj_name: str) -> Tuple[types.ModuleType, str]:
-    """Searches for the underlying module behind the name to some python object.
-    Returns the module and the object name (original name with module part removed)."""
+def _search_module_from_obj_name(obj_name: str) -> Tuple[types.ModuleType, str]:
+    """Searches for the underlying module behind the name to some python object, without caching."""
 
     # allow convenience shorthands, substitute them by full names
     obj_name = re.sub("^np.", "numpy.", obj_name)
@@ -260,6 +407,68 @@ def get_module_from_obj_name(obj_name: str) -> Tuple[types.ModuleType, str]:
     raise ImportError(obj_name)
 
 
+_obj_name_cache = dict() # name => (module, local_obj_name, obj) or the exception raised while resolving it
+_obj_name_cache_lock = threading.Lock()
+_obj_name_cache_num_modules = None
+
+
+def _resolve_obj_name(obj_name: str) -> Tuple[types.ModuleType, str, Any]:
+    """Memoized lookup of (module, local_obj_name, obj) for the given name.
+    The cache, including failed lookups, is dropped whenever the set of imported modules grows or shrinks."""
+    global _obj_name_cache_num_modules
+
+    entry = _obj_name_cache.get(obj_name)
+    if entry.__class__ is tuple and _obj_name_cache_num_modules == len(sys.modules):
+        return entry
+
+    if _obj_name_cache_num_modules != len(sys.modules):
+        with _obj_name_cache_lock:
+            if _obj_name_cache_num_modules != len(sys.modules):
+                _obj_name_cache.clear()
+                _obj_name_cache_num_modules = len(sys.modules)
+        entry = None
+
+    if entry is None:
+        try:
+            module, local_obj_name = _search_module_from_obj_name(obj_name)
+            entry = (module, local_obj_name, get_obj_from_module(module, local_obj_name))
+        except Exception as e:
+            _cache_obj_name(obj_name, e)
+            raise # with the original traceback, e.g. into a plugin that fails to import
+        _cache_obj_name(obj_name, entry)
+        return entry
+
+    # a cached failure: raise a fresh exception, so the stored one's traceback is shown but not extended
+    try:
+        error = entry.__class__(*entry.args)
+    except Exception:
+        error = ImportError(str(entry))
+    raise error from entry
+
+
+def _cache_obj_name(obj_name: str, entry: Any) -> None:
+    global _obj_name_cache_num_modules
+    with _obj_name_cache_lock:
+        # resolving may import modules itself; older entries are stale then, but this one is not
+        if _obj_name_cache_num_modules != len(sys.modules):
+            _obj_name_cache.clear()
+            _obj_name_cache_num_modules = len(sys.modules)
+        _obj_name_cache[obj_name] = entry
+
+
+def clear_obj_name_cache() -> None:
+    """Forget all resolved object names, e.g. after importlib.reload()."""
+    with _obj_name_cache_lock:
+        _obj_name_cache.clear()
+
+
+def get_module_from_obj_name(obj_name: str) -> Tuple[types.ModuleType, str]:
+    """Searches for the underlying module behind the name to some python object.
+    Returns the module and the object name (original name with module part removed)."""
+    module, local_obj_name, _obj = _resolve_obj_name(obj_name)
+    return module, local_obj_name
+
+
 def get_obj_from_module(module: types.ModuleType, obj_name: str) -> Any:
     """Traverses the object name and returns the last (rightmost) python object."""
     if obj_name == '':
@@ -272,8 +481,7 @@ def get_obj_from_module(module: types.ModuleType, obj_name: str) -> Any:
 
 def get_obj_by_name(name: str) -> Any:
     """Finds the python object with the given name."""
-    module, obj_name = get_module_from_obj_name(name)
-    return get_obj_from_module(module, obj_name)
+    return _resolve_obj_name(name)[2]
 
 
 def call_func_by_name(*args, func_name: str = None, **kwargs) -> Any:
@@ -312,50 +520,740 @@ def get_top_level_function_name(obj: Any) -> str:
 # File system helpers
 # ------------------------------------------------------------------------------------------
 
+def _compile_ignores(ignores: List[str]) -> Any:
+    """Combines fnmatch-style patterns into one compiled matcher; returns None if there are none."""
+    if not ignores:
+        return None
+    return re.compile("|".join("(?:%s)" % fnmatch.translate(os.path.normcase(p)) for p in ignores)).match
+
+
 def list_dir_recursively_with_ignore(dir_path: str, ignores: List[str] = None, add_base_to_relative: bool = False) -> List[Tuple[str, str]]:
     """List all files recursively in a given directory while ignoring given file and directory names.
     Returns list of tuples containing both absolute and relative paths."""
     assert os.path.isdir(dir_path)
     base_name = os.path.basename(os.path.normpath(dir_path))
-
-    if ignores is None:
-        ignores = []
+    is_ignored = _compile_ignores(ignores)
+    normcase = os.path.normcase
 
     result = []
 
-    for root, dirs, files in os.walk(dir_path, topdown=True):
-        for ignore_ in ignores:
-            dirs_to_remove = [d for d in dirs if fnmatch.fnmatch(d, ignore_)]
+    def walk(abs_dir, rel_dir):
+        try:
+            with os.scandir(abs_dir) as it:
+                entries = list(it)
+        except OSError:
+            return # unreadable directories are skipped, like os.walk() does
+
+        subdirs = []
+        for entry in entries:
+            if is_ignored is not None and is_ignored(normcase(entry.name)):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                result.append((os.path.join(abs_dir, entry.name), rel_dir + entry.name))
+            elif not entry.is_symlink(): # symlinked directories are not followed
+                subdirs.append(entry.name)
+
+        for name in subdirs:
+            walk(os.path.join(abs_dir, name), rel_dir + name + os.sep)
+
+    walk(dir_path, os.path.join(base_name, "") if add_base_to_relative else "")
+    return result
 
-            # dirs need to be edited in-place
-            for d in dirs_to_remove:
-                dirs.remove(d)
 
-            files = [f for f in files if not fnmatch.fnmatch(f, ignore_)]
+_COPY_MODES = ("copy", "hardlink", "reflink")
+_FICLONE = 0x40049409 # Linux ioctl that shares the source's extents (btrfs, XFS, ...)
+_reflink_unsupported_devs = set()
 
-        absolute_paths = [os.path.join(root, f) for f in files]
-        relative_paths = [os.path.relpath(p, dir_path) for p in absolute_paths]
 
-        if add_base_to_relative:
-            relative_paths = [os.path.join(base_name, p) for p in relative_paths]
+def _reflink_file(src: str, dst: str) -> None:
+    """Makes dst a copy-on-write clone of src; raises OSError where that is unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflinks are not supported on this platform")
 
-        assert len(absolute_paths) == len(relative_paths)
-        result += zip(absolute_paths, relative_paths)
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
 
-    return result
 
+def _copy_file(src: str, dst: str, mode: str, skip_unchanged: bool) -> bool:
+    """Copies a single file; returns False if it was skipped as unchanged."""
+    if skip_unchanged:
+        src_stat = os.stat(src)
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            dst_stat = None
+        if dst_stat is not None and (os.path.samestat(src_stat, dst_stat) or
+                (dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns)):
+            return False
+
+    if mode != "copy" and os.path.lexists(dst):
+        # never truncate or unlink the source through an existing link to it
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            if mode == "hardlink":
+                return False
+            raise shutil.SameFileError("{!r} and {!r} are the same file".format(src, dst))
+        os.remove(dst)
+
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return True
+        except OSError:
+            pass # e.g. across file systems; fall back to a copy
+    elif mode == "reflink":
+        dst_dev = os.stat(os.path.dirname(dst) or ".").st_dev
+        if dst_dev not in _reflink_unsupported_devs:
+            try:
+                _reflink_file(src, dst)
+                mode = None
+            except OSError:
+                _reflink_unsupported_devs.add(dst_dev) # don't keep trying on this file system
+
+    if mode is not None:
+        shutil.copyfile(src, dst)
+    if skip_unchanged:
+        os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns)) # lets the next run recognize the file
+    return True
 
-def copy_files_and_create_dirs(files: List[Tuple[str, str]]) -> None:
+
+def copy_files_and_create_dirs(files: List[Tuple[str, str]], mode: str = "copy", num_workers: int = None, skip_unchanged: bool = False) -> int:
     """Takes in a list of tuples of (src, dst) paths and copies files.
-    Will create all necessary directories."""
-    for file in files:
-        target_dir_name = os.path.dirname(file[1])
+    Will create all necessary directories.
+
+    mode "hardlink" links the files instead and "reflink" makes copy-on-write clones; both fall back to
+    a regular copy where the file system does not support them.  With skip_unchanged, files whose
+    destination has the same size and mtime are left alone, and copies take the source's mtime.
+    Files are copied by num_workers threads (default: one per CPU).  Returns the number of files copied."""
+    assert mode in _COPY_MODES
+
+    # will create all intermediate-level directories, once per directory
+    for target_dir_name in sorted(set(os.path.dirname(file[1]) for file in files)):
+        if target_dir_name:
+            os.makedirs(target_dir_name, exist_ok=True)
+
+    def copy_batch(batch):
+        return sum(_copy_file(src, dst, mode, skip_unchanged) for src, dst in batch)
+
+    if num_workers is None:
+        num_workers = min(32, os.cpu_count() or 1)
+
+    if num_workers <= 1 or len(files) < 2 * num_workers:
+        return copy_batch(files)
+
+    # one interleaved batch per worker rather than one task per (usually small) file
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        return sum(executor.map(copy_batch, [files[i::num_workers] for i in range(num_workers)]))
+
+
+# Download cache
+# ------------------------------------------------------------------------------------------
+
+_dnnlib_cache_max_bytes = None
+
+def set_cache_max_bytes(max_bytes: int) -> None:
+    """Set the byte budget of download caches (None = unbounded)."""
+    global _dnnlib_cache_max_bytes
+    _dnnlib_cache_max_bytes = max_bytes
+
+def get_cache_max_bytes() -> int:
+    if _dnnlib_cache_max_bytes is not None:
+        return _dnnlib_cache_max_bytes
+    if 'DNNLIB_CACHE_MAX_BYTES' in os.environ:
+        return int(os.environ['DNNLIB_CACHE_MAX_BYTES'])
+    return None
+
+
+class FileLock(object):
+    """Exclusive lock on a lock file, shared by threads and processes on the same host.
+    Every instance opens its own handle, so use one instance per acquisition."""
+
+    def __init__(self, path: str, blocking: bool = True):
+        self.path = path
+        self.blocking = blocking
+        self.file = None
+
+    def acquire(self) -> bool:
+        """Acquire the lock. Returns False if non-blocking and the lock is held elsewhere."""
+        self.file = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                mode = msvcrt.LK_NBLCK
+                while True:
+                    try:
+                        self.file.seek(0)
+                        msvcrt.locking(self.file.fileno(), mode, 1)
+                        break
+                    except OSError:
+                        if not self.blocking:
+                            raise
+                        time.sleep(0.05)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | (0 if self.blocking else fcntl.LOCK_NB))
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    def release(self) -> None:
+        if self.file is None:
+            return
+        if os.name == "nt":
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self) -> "FileLock":
+        if not self.acquire():
+            raise OSError("Could not acquire lock %s" % self.path)
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.release()
+
+
+class DownloadCache(object):
+    """Download cache directory with a persistent index, a byte budget with LRU
+    eviction and cleanup of abandoned partial downloads.
+
+    The index (index.json) maps URL hashes to cached file name, size, last
+    access time and SHA-256 of the content, so lookups don't scan the
+    directory.  All index updates happen under an inter-process file lock;
+    per-URL locks let concurrent fetches of the same URL share one download."""
+
+    INDEX_VERSION = 1
+    ACCESS_RESOLUTION = 60.0 # seconds; last access is only persisted this often
+
+    def __init__(self, cache_dir: str, max_bytes: int = None, stale_seconds: float = 24 * 60 * 60):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock_dir = os.path.join(cache_dir, "locks")
+        self.entries = {}
+        self._index_stat = None
+        self._thread_lock = threading.Lock()
+
+    def lock(self, url_md5: str, blocking: bool = True) -> FileLock:
+        """Lock guarding the download of one URL."""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return FileLock(os.path.join(self.lock_dir, url_md5 + ".lock"), blocking)
+
+    def _index_lock(self) -> FileLock:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return FileLock(os.path.join(self.lock_dir, "index.lock"))
+
+    def _load(self) -> None:
+        """Reload the index if another process changed it. Caller holds the index lock."""
+        try:
+            st = os.stat(self.index_file)
+        except FileNotFoundError:
+            if self._index_stat is None:
+                self._adopt_existing_files()
+            return
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._index_stat:
+            return
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+            self.entries = index["entries"] if index.get("version") == self.INDEX_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+        self._index_stat = stat_key
+
+    def _save(self) -> None:
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": self.INDEX_VERSION, "entries": self.entries}, f)
+        os.replace(temp_file, self.index_file)
+        st = os.stat(self.index_file)
+        self._index_stat = (st.st_mtime_ns, st.st_size)
+
+    def _adopt_existing_files(self) -> None:
+        """Index files cached before the index existed (one directory scan)."""
+        self.entries = {}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and re.match(r"^[0-9a-f]{32}_", entry.name):
+                st = entry.stat()
+                self.entries[entry.name[:32]] = {"file": entry.name, "size": st.st_size, "last_access": st.st_mtime, "sha256": None}
+        self._save()
+
+    def lookup(self, url_md5: str, open_file: bool = False) -> Any:
+        """Return the cached filename for the URL hash, or None.
+        With open_file, return the file opened for reading instead; it is opened before the
+        index lock is released, so another process can't evict it in between."""
+        if not os.path.isdir(self.cache_dir):
+            return None
+        with self._thread_lock, self._index_lock():
+            self._load()
+            entry = self.entries.get(url_md5)
+            if entry is None:
+                return None
+            filename = os.path.join(self.cache_dir, entry["file"])
+            if not os.path.isfile(filename):
+                del self.entries[url_md5]
+                self._save()
+                return None
+            now = time.time()
+            if now - entry["last_access"] > self.ACCESS_RESOLUTION:
+                entry["last_access"] = now
+                self._save()
+            return open(filename, "rb") if open_file else filename
+
+    def add(self, url_md5: str, filename: str) -> None:
+        """Record a newly downloaded file, then evict and clean up as needed.
+        The entry keeps the file's size, mtime and inode at hashing time, see hashed_digest()."""
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            st = os.fstat(f.fileno())
+            for chunk in iter(lambda: f.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        entry = {"file": os.path.basename(filename), "size": st.st_size, "last_access": time.time(), "sha256": digest.hexdigest(),
+            "stat": [st.st_size, st.st_mtime_ns, st.st_ino]}
+
+        with self._thread_lock, self._index_lock():
+            self._load()
+            self.entries[url_md5] = entry
+            self._evict(keep=url_md5)
+            self._cleanup_partials()
+            self._save()
+
+    def hashed_digest(self, url_md5: str, filename: str) -> str:
+        """SHA-256 recorded for a cached file, or None if the file changed since it was hashed."""
+        with self._thread_lock, self._index_lock():
+            self._load()
+            entry = self.entries.get(url_md5)
+        if entry is None or entry.get("file") != os.path.basename(filename) or entry.get("stat") is None:
+            return None
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return entry["sha256"] if entry["stat"] == [st.st_size, st.st_mtime_ns, st.st_ino] else None
+
+    def remove(self, url_md5: str) -> None:
+        """Drop a cached file, e.g. one that was modified after it was downloaded."""
+        with self._thread_lock, self._index_lock():
+            self._load()
+            entry = self.entries.pop(url_md5, None)
+            if entry is not None:
+                _remove_files(os.path.join(self.cache_dir, entry["file"]))
+                self._save()
+
+    def _evict(self, keep: str = None) -> None:
+        """Delete least recently used files until the cache fits the byte budget.
+        Files whose URL lock is held (being downloaded or opened) are skipped."""
+        if self.max_bytes is None:
+            return
+        total = sum(entry["size"] for entry in self.entries.values())
+        for url_md5, entry in sorted(self.entries.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if url_md5 == keep:
+                continue
+            url_lock = self.lock(url_md5, blocking=False)
+            if not url_lock.acquire():
+                continue # in use; try again next time
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue # e.g. still open on Windows; try again next time
+            finally:
+                url_lock.release()
+            del self.entries[url_md5]
+            total -= entry["size"]
+
+    def _cleanup_partials(self) -> None:
+        """Delete partial downloads untouched for stale_seconds whose URL isn't being downloaded."""
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.startswith("tmp_") or not entry.is_file():
+                continue
+            try:
+                if now - entry.stat().st_mtime < self.stale_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            match = re.match(r"^tmp_([0-9a-f]{32})\.partial", entry.name)
+            url_lock = self.lock(match[1], blocking=False) if match else None
+            if url_lock is not None and not url_lock.acquire():
+                continue # download in progress
+            try:
+                _remove_files(entry.path)
+            finally:
+                if url_lock is not None:
+                    url_lock.release()
+
+    def total_bytes(self) -> int:
+        with self._thread_lock, self._index_lock():
+            self._load()
+            return sum(entry["size"] for entry in self.entries.values())
+
 
-        # will create all intermediate-level directories
-        if not os.path.exists(target_dir_name):
-            os.makedirs(target_dir_name)
+_download_caches = dict()
+_download_caches_lock = threading.Lock()
 
-        shutil.copyfile(file[0], file[1])
+def get_download_cache(cache_dir: str) -> DownloadCache:
+    """Shared DownloadCache instance for a directory, using the configured byte budget."""
+    with _download_caches_lock:
+        download_cache = _download_caches.get(cache_dir)
+        if download_cache is None:
+            download_cache = _download_caches[cache_dir] = DownloadCache(cache_dir)
+        download_cache.max_bytes = get_cache_max_bytes()
+        return download_cache
+
+
+# Model store
+# ------------------------------------------------------------------------------------------
+
+class ModelStore(object):
+    """Content-addressed store of model files, shared by all processes on a host.
+
+    Blobs live in blobs/<xx>/<sha256>, keyed by the SHA-256 of their content, so the
+    same weights fetched from two URLs or added from two paths are stored once.  Files
+    are added by hard-linking them into the store where possible, and a duplicate of a
+    stored blob is replaced by a hard link to it.  Names (e.g. a URL or a model name)
+    map to digests in refs.json.
+
+    Blobs are hashed again on first use; the result is remembered in verified.json
+    together with the blob's size, mtime and inode, so later uses only stat the file.
+    Blobs are shared, so never modify one in place.
+
+    Where hard links are unavailable (another volume, FAT/exFAT), copies made by
+    export() and files kept in place by add_file(copy=False) are recorded with their
+    digest and stat in files.json, so they are neither hashed nor copied again while
+    they stay unchanged."""
+
+    def __init__(self, root: str = None):
+        self.root = root if root is not None else make_cache_dir_path("models")
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        self.refs_file = os.path.join(self.root, "refs.json")
+        self.verified_file = os.path.join(self.root, "verified.json")
+        self.files_file = os.path.join(self.root, "files.json")
+        self.lock_dir = os.path.join(self.root, "locks")
+        self._json_cache = dict() # file => (stat key, contents)
+        self._thread_lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _lock(self) -> FileLock:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return FileLock(os.path.join(self.lock_dir, "store.lock"))
+
+    def _read_json(self, path: str) -> dict:
+        """Contents of refs.json or verified.json, reloaded only if the file changed."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return dict()
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._json_cache.get(path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        try:
+            with open(path, "r") as f:
+                contents = json.load(f)
+        except (OSError, ValueError):
+            contents = dict()
+        self._json_cache[path] = (stat_key, contents)
+        return contents
+
+    def _update_json(self, path: str, key: str, value: Any) -> None:
+        """Set (or, if value is None, delete) one key of refs.json, verified.json or files.json."""
+        with self._thread_lock, self._lock():
+            contents = dict(self._read_json(path))
+            if value is None:
+                contents.pop(key, None)
+            else:
+                contents[key] = value
+            temp_file = path + ".tmp"
+            with open(temp_file, "w") as f:
+                json.dump(contents, f)
+            os.replace(temp_file, path)
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> List[int]:
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _mark_verified(self, digest: str) -> None:
+        self._update_json(self.verified_file, digest, self._stat_key(os.stat(self.blob_path(digest))))
+
+    def _verified_digest(self, st: os.stat_result) -> str:
+        """Digest of a verified blob with the same inode, size and mtime as st, or None."""
+        stat_key = self._stat_key(st)
+        for digest, verified_key in self._read_json(self.verified_file).items():
+            if verified_key == stat_key and os.path.exists(self.blob_path(digest)):
+                return digest
+        return None
+
+    def _record_file(self, path: str, digest: str) -> None:
+        """Remember that a file outside the store holds the given content."""
+        self._update_json(self.files_file, os.path.abspath(path), [digest] + self._stat_key(os.stat(path)))
+
+    def _recorded_digest(self, path: str, st: os.stat_result) -> str:
+        """Digest recorded for a file outside the store, if it is unchanged since; else None."""
+        record = self._read_json(self.files_file).get(os.path.abspath(path))
+        if record is not None and record[1:] == self._stat_key(st):
+            return record[0]
+        return None
+
+    def _hash_file(self, path: str) -> str:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def resolve(self, name: str) -> str:
+        """Digest for a name or digest, or None if unknown."""
+        if re.match(r"^[0-9a-f]{64}$", name):
+            return name
+        return self._read_json(self.refs_file).get(name)
+
+    def tag(self, name: str, digest: str) -> None:
+        """Point a name at a stored blob."""
+        self._update_json(self.refs_file, name, digest)
+
+    def _commit(self, temp_file: str, digest: str, verified: bool) -> None:
+        """Move a fully written file into place, unless the blob already exists.
+        Only mark it verified if digest was computed over exactly these bytes;
+        otherwise get() hashes it on first use."""
+        blob = self.blob_path(digest)
+        with self._thread_lock, self._lock():
+            if os.path.exists(blob):
+                os.remove(temp_file)
+                return
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(temp_file, blob)
+        if verified:
+            self._mark_verified(digest)
+
+    def add_stream(self, stream: Any, name: str = None) -> str:
+        """Store the contents of a binary file object, hashing it while it is written. Returns its digest."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(dir=self.tmp_dir)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+            self._commit(temp_file, digest.hexdigest(), verified=True)
+        except:
+            _remove_files(temp_file)
+            raise
+        if name is not None:
+            self.tag(name, digest.hexdigest())
+        return digest.hexdigest()
+
+    def add_file(self, path: str, name: str = None, link: bool = True, sha256: str = None, copy: bool = True) -> str:
+        """Store a file, by hard link if link is set and the file system allows it. Returns its digest.
+
+        If the content is already stored, the file is replaced by a hard link to the existing blob.
+        If the file can't be linked into the store and copy is False, it is recorded in place
+        instead of being copied, and get() returns it for as long as it is unchanged.
+        sha256 may pass a digest already computed for the file, saving a pass over it; the
+        caller must have checked that the file is unchanged since.  A blob stored without
+        hashing it here is hashed again by get() on first use."""
+        st = os.stat(path)
+        digest = self._verified_digest(st)
+        verified = digest is not None
+        if digest is None:
+            digest = sha256 or self._recorded_digest(path, st)
+        if digest is None:
+            digest = self._hash_file(path)
+            verified = True
+
+        blob = self.blob_path(digest)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        temp_file = os.path.join(self.tmp_dir, "%s.%d.%d" % (digest, os.getpid(), threading.get_ident()))
+        linked = False
+        if os.path.exists(blob):
+            linked = os.path.samefile(path, blob)
+            if link and not linked:
+                try:
+                    os.link(blob, temp_file)
+                    os.replace(temp_file, path) # deduplicate: the file becomes another name of the blob
+                    linked = True
+                except OSError:
+                    _remove_files(temp_file)
+        else:
+            try:
+                if not link:
+                    raise OSError
+                os.link(path, temp_file)
+                linked = True
+            except OSError:
+                if copy:
+                    shutil.copyfile(path, temp_file)
+            if linked or copy:
+                self._commit(temp_file, digest, verified)
+
+        if not linked and self._recorded_digest(path, os.stat(path)) != digest:
+            self._record_file(path, digest)
+
+        if name is not None:
+            self.tag(name, digest)
+        return digest
+
+    def get(self, name: str, verify: bool = True) -> str:
+        """Path of the blob for a name or digest, verifying its content on first use.
+        Falls back to a recorded, unchanged file outside the store if there is no blob."""
+        digest = self.resolve(name)
+        if digest is None:
+            raise KeyError(name)
+        blob = self.blob_path(digest)
+        if not os.path.isfile(blob):
+            return self._get_recorded_file(name, digest, verify)
+
+        if verify and self._read_json(self.verified_file).get(digest) != self._stat_key(os.stat(blob)):
+            actual = self._hash_file(blob)
+            if actual != digest:
+                _remove_files(blob)
+                raise IOError("Stored model {} is corrupt (SHA-256 {}); removed it".format(digest, actual))
+            self._mark_verified(digest)
+        return blob
+
+    def _get_recorded_file(self, name: str, digest: str, verify: bool) -> str:
+        modified = None
+        for path, record in self._read_json(self.files_file).items():
+            if record[0] != digest:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._update_json(self.files_file, path, None)
+                continue
+            if record[1:] == self._stat_key(st) or not verify:
+                return path
+            if self._hash_file(path) == digest: # touched but unchanged
+                self._record_file(path, digest)
+                return path
+            self._update_json(self.files_file, path, None) # modified; it is not ours to delete
+            modified = path
+        if modified is not None:
+            raise IOError("{} no longer matches stored model {}".format(modified, digest))
+        raise KeyError(name)
+
+    def export(self, name: str, path: str) -> str:
+        """Make path a hard link to (or, across file systems, a copy of) the verified blob for a name. Returns path.
+        A recorded copy that is still unchanged is left alone."""
+        blob = self.get(name)
+        if os.path.exists(path):
+            if os.path.samefile(path, blob) or self._recorded_digest(path, os.stat(path)) == self.resolve(name):
+                return path
+        temp_file = path + ".%d.tmp" % os.getpid()
+        try:
+            os.link(blob, temp_file)
+            os.replace(temp_file, path)
+        except OSError:
+            _remove_files(temp_file)
+            shutil.copyfile(blob, temp_file)
+            os.replace(temp_file, path)
+            self._record_file(path, self.resolve(name))
+        return path
+
+    def fetch(self, url: str, name: str = None, sha256: str = None, **open_url_kwargs: Any) -> str:
+        """Download a URL into the store (via the open_url() cache) unless its content is already stored.
+        Returns the path of the verified blob. sha256 optionally pins the expected content."""
+        stored = self.resolve(sha256 or url)
+        if stored is not None and os.path.exists(self.blob_path(stored)):
+            return self.get(stored)
+
+        cache_dir = open_url_kwargs.pop("cache_dir", None) or make_cache_dir_path("downloads")
+        download_cache = get_download_cache(cache_dir)
+        url_md5 = hashlib.md5(url.encode("utf-8")).hexdigest()
+        filename = open_url(url, cache_dir=cache_dir, return_filename=True, **open_url_kwargs)
+        known_sha256 = download_cache.hashed_digest(url_md5, filename)
+        if known_sha256 is None:
+            # Changed since it was hashed (e.g. a corrupt blob it is linked to), or never hashed; fetch it again.
+            download_cache.remove(url_md5)
+            filename = open_url(url, cache_dir=cache_dir, return_filename=True, **open_url_kwargs)
+            known_sha256 = download_cache.hashed_digest(url_md5, filename)
+
+        digest = self.add_file(filename, name=url, sha256=known_sha256)
+        if sha256 is not None and digest != sha256:
+            raise IOError("Downloaded {} has SHA-256 {}, expected {}".format(url, digest, sha256))
+        if name is not None:
+            self.tag(name, digest)
+        return self.get(digest)
+
+    def load_safetensors(self, name: str) -> dict:
+        """Memory-map the tensors of a stored .safetensors blob, see mmap_safetensors()."""
+        return mmap_safetensors(self.get(name))
+
+
+_model_stores = dict()
+_model_stores_lock = threading.Lock()
+
+def get_model_store(root: str = None) -> ModelStore:
+    """Shared ModelStore instance, by default under make_cache_dir_path('models')."""
+    root = root if root is not None else make_cache_dir_path("models")
+    with _model_stores_lock:
+        model_store = _model_stores.get(root)
+        if model_store is None:
+            model_store = _model_stores[root] = ModelStore(root)
+        return model_store
+
+
+_SAFETENSORS_DTYPES = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16,
+    "BF16": np.uint16, # no numpy bfloat16; exposed as raw bits
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8,
+    "U64": np.uint64, "U32": np.uint32, "U16": np.uint16, "U8": np.uint8,
+    "BOOL": np.bool_,
+}
+
+def read_safetensors_header(f: Any) -> Tuple[dict, int]:
+    """Parse the header of a .safetensors file. Returns the header and the offset where tensor data starts."""
+    f.seek(0)
+    header_len = int.from_bytes(f.read(8), "little")
+    header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+def mmap_safetensors(path: str) -> dict:
+    """Read-only numpy views of all tensors in a .safetensors file, backed by a shared memory map.
+
+    Nothing is copied: pages are read on demand and come from the page cache, so every
+    process on the host mapping the same file (or a hard link to it) shares one copy."""
+    import mmap
+
+    with open(path, "rb") as f:
+        header, data_start = read_safetensors_header(f)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays valid after the file is closed
+
+    tensors = dict()
+    for tensor_name, info in header.items():
+        if tensor_name == "__metadata__":
+            continue
+        dtype = np.dtype(_SAFETENSORS_DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        count = int(np.prod(info["shape"], dtype=np.int64))
+        if end - begin != count * dtype.itemsize or data_start + end > len(buffer):
+            raise ValueError("Invalid data offsets for tensor '{}' in {}".format(tensor_name, path))
+        tensors[tensor_name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin).reshape(info["shape"])
+    return tensors
 
 
 # URL helpers
@@ -379,9 +1277,11 @@ def is_url(obj: Any, allow_file_urls: bool = False) -> bool:
     return True
 
 
-def open_url(url: str, cache_dir: str = None, num_attempts: int = 10, verbose: bool = True, return_filename: bool = False, cache: bool = True) -> Any:
-    """Download the given URL and return a binary-mode file object to access the data."""
+def open_url(url: str, cache_dir: str = None, num_attempts: int = 10, verbose: bool = True, return_filename: bool = False, cache: bool = True, num_connections: int = 1) -> Any:
+    """Download the given URL and return a binary-mode file object to access the data.
+    With num_connections > 1, large cached downloads are fetched as parallel byte ranges."""
     assert num_attempts >= 1
+    assert num_connections >= 1
     assert not (return_filename and (not cache))
 
     # Doesn't look like an URL scheme so interpret it as a local filename.
@@ -415,63 +1315,376 @@ def open_url(url: str, cache_dir: str = None, num_attempts: int = 10, verbose: b
         cache_dir = make_cache_dir_path('downloads')
 
     url_md5 = hashlib.md5(url.encode("utf-8")).hexdigest()
+    if not cache:
+        return _download_url(url, None, url_md5, num_attempts, verbose, num_connections)
+
+    # Files are opened while the index or URL lock is held, so that a
+    # concurrent eviction can't remove them in between.
+    download_cache = get_download_cache(cache_dir)
+    result = download_cache.lookup(url_md5, open_file=not return_filename)
+    if result is None:
+        # Concurrent fetches of the same URL, from threads or processes, wait
+        # for a single download and then find it in the cache.
+        with download_cache.lock(url_md5):
+            result = download_cache.lookup(url_md5, open_file=not return_filename)
+            if result is None:
+                filename = _download_url(url, cache_dir, url_md5, num_attempts, verbose, num_connections)
+                download_cache.add(url_md5, filename)
+                result = filename if return_filename else open(filename, "rb")
+    return result
+
+
+def _download_url(url: str, cache_dir: str, url_md5: str, num_attempts: int, verbose: bool, num_connections: int) -> Any:
+    """Download the URL into the cache directory and return the cached filename,
+    or into an anonymous temp file object if cache_dir is None."""
+    cache = cache_dir is not None
+
+    # Download.  Data is streamed in chunks straight to a partial file (or an
+    # anonymous temp file when not caching), so memory use stays bounded
+    # regardless of the file size.  An interrupted download resumes from the
+    # partial file with an HTTP Range request on the next attempt or call.
     if cache:
-        cache_files = glob.glob(os.path.join(cache_dir, url_md5 + "_*"))
-        if len(cache_files) == 1:
-            filename = cache_files[0]
-            return filename if return_filename else open(filename, "rb")
+        os.makedirs(cache_dir, exist_ok=True)
+        partial_file = os.path.join(cache_dir, "tmp_" + url_md5 + ".partial")
+        meta_file = partial_file + ".json"
+        meta = _read_partial_meta(meta_file) if os.path.isfile(partial_file) else {}
+    else:
+        data_file = tempfile.TemporaryFile()
+        meta = {}
 
-    # Download.
     url_name = None
-    url_data = None
     with requests.Session() as session:
         if verbose:
             print("Downloading %s ..." % url, end="", flush=True)
-        for attempts_left in reversed(range(num_attempts)):
+
+        # Opt-in parallel mode for large files on servers that support ranges.
+        # A partial file left by a parallel download must be finished in
+        # parallel mode, since it is sparse rather than a contiguous prefix.
+        parallel = cache and (num_connections > 1 or "segment_size" in meta)
+        if parallel and not _probe_ranges(session, url, meta, partial_file):
+            parallel = False
+        if not parallel and "segment_size" in meta:
+            # A sparse parallel partial file can't be resumed as a stream.
+            _remove_files(partial_file)
+            meta.clear()
+        if parallel:
             try:
-                with session.get(url) as res:
-                    res.raise_for_status()
-                    if len(res.content) == 0:
-                        raise IOError("No data received")
-
-                    if len(res.content) < 8192:
-                        content_str = res.content.decode("utf-8")
-                        if "download_warning" in res.headers.get("Set-Cookie", ""):
-                            links = [html.unescape(link) for link in content_str.split('"') if "export=download" in link]
-                            if len(links) == 1:
-                                url = requests.compat.urljoin(url, links[0])
-                                raise IOError("Google Drive virus checker nag")
-                        if "Google Drive - Quota exceeded" in content_str:
-                            raise IOError("Google Drive download quota exceeded -- please try again later")
-
-                    match = re.search(r'filename="([^"]*)"', res.headers.get("Content-Disposition", ""))
-                    url_name = match[1] if match else url
-                    url_data = res.content
-                    if verbose:
-                        print(" done")
-                    break
+                url_name = _download_parallel(url, partial_file, meta, meta_file, max(num_connections, 2), num_attempts, verbose)
             except KeyboardInterrupt:
                 raise
             except:
-                if not attempts_left:
+                if verbose:
+                    print(" failed")
+                raise
+            if verbose:
+                print(" done")
+        else:
+            for attempts_left in reversed(range(num_attempts)):
+                try:
+                    if cache:
+                        data_file = open(partial_file, "ab")
+                    data_file.seek(0, os.SEEK_END)
+                    try:
+                        url_name = _stream_url_to_file(session, url, data_file, meta, verbose, meta_file if cache else None)
+                    finally:
+                        if cache:
+                            data_file.close()
+                            _write_partial_meta(meta_file, meta)
                     if verbose:
-                        print(" failed")
+                        print(" done")
+                    break
+                except KeyboardInterrupt:
                     raise
-                if verbose:
-                    print(".", end="", flush=True)
+                except _RedirectDownload as redirect:
+                    # Restart from the link behind Google Drive's virus checker nag.
+                    url = redirect.url
+                    meta.clear()
+                    if cache:
+                        _remove_files(partial_file, meta_file)
+                    else:
+                        data_file.truncate(0)
+                    if not attempts_left:
+                        if verbose:
+                            print(" failed")
+                        raise
+                    if verbose:
+                        print(".", end="", flush=True)
+                except:
+                    if not attempts_left:
+                        if verbose:
+                            print(" failed")
+                        raise
+                    if verbose:
+                        print(".", end="", flush=True)
 
     # Save to cache.
     if cache:
         safe_name = re.sub(r"[^0-9a-zA-Z-._]", "_", url_name)
         cache_file = os.path.join(cache_dir, url_md5 + "_" + safe_name)
-        temp_file = os.path.join(cache_dir, "tmp_" + uuid.uuid4().hex + "_" + url_md5 + "_" + safe_name)
-        os.makedirs(cache_dir, exist_ok=True)
-        with open(temp_file, "wb") as f:
-            f.write(url_data)
-        os.replace(temp_file, cache_file) # atomic
-        if return_filename:
-            return cache_file
+        os.replace(partial_file, cache_file) # atomic
+        _remove_files(meta_file)
+        return cache_file
 
     # Return data as file object.
-    assert not return_filename
-    return io.BytesIO(url_data)
+    data_file.seek(0)
+    return data_file
+
+
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+_PARALLEL_MIN_SIZE = 64 << 20 # smaller files are always downloaded as a single stream
+_PARALLEL_MIN_SEGMENT = 8 << 20
+
+
+class _RedirectDownload(IOError):
+    """Raised when the download must restart from a different URL."""
+
+    def __init__(self, message: str, url: str):
+        super().__init__(message)
+        self.url = url
+
+
+def _read_partial_meta(meta_file: str) -> dict:
+    """Load the resume metadata stored next to a partial download."""
+    try:
+        with open(meta_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_partial_meta(meta_file: str, meta: dict) -> None:
+    with open(meta_file, "w") as f:
+        json.dump(meta, f)
+
+
+def _remove_files(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _DownloadProgress(object):
+    """Print downloaded bytes and throughput at most every `interval` seconds."""
+
+    def __init__(self, verbose: bool, url: str, done: int, total: int = None, interval: float = 0.5):
+        self.verbose = verbose
+        self.url = url
+        self.done = done
+        self.total = total
+        self.interval = interval
+        self.start_done = done
+        self.start_time = time.time()
+        self.last_print = 0.0
+
+    def update(self, num_bytes: int, force: bool = False) -> None:
+        self.done += num_bytes
+        now = time.time()
+        if not self.verbose or (not force and now - self.last_print < self.interval):
+            return
+        self.last_print = now
+        rate = (self.done - self.start_done) / max(now - self.start_time, 1e-6)
+        if self.total:
+            status = "%s / %s (%d%%)" % (format_size(self.done), format_size(self.total), 100 * self.done // self.total)
+        else:
+            status = format_size(self.done)
+        print("\rDownloading %s ... %s, %s/s" % (self.url, status, format_size(rate)), end="", flush=True)
+
+
+def _stream_url_to_file(session: requests.Session, url: str, file: Any, meta: dict, verbose: bool, meta_file: str = None) -> str:
+    """Stream the URL into `file`, resuming from its current size if possible.
+    Updates `meta` with the resume validator, writing it to `meta_file` before any data,
+    and returns the download's file name."""
+    offset = file.tell()
+    if offset > 0 and not meta.get("validator"):
+        # Without a validator there is no telling whether the partial data
+        # belongs to the current version of the resource; start over.
+        offset = 0
+        file.seek(0)
+        file.truncate()
+    headers = {}
+    if offset > 0:
+        headers["Range"] = "bytes=%d-" % offset
+        headers["If-Range"] = meta["validator"]
+
+    with session.get(url, headers=headers, stream=True) as res:
+        if res.status_code == 416 and offset > 0:
+            # The partial file doesn't match the resource any more; start over.
+            file.truncate(0)
+            meta.clear()
+            raise IOError("Requested range not satisfiable")
+        res.raise_for_status()
+        if res.status_code != 206:
+            offset = 0 # server ignored or rejected the range
+            file.seek(0)
+            file.truncate()
+
+        # Record what the partial file will hold before writing any of it, so
+        # that a process killed mid-download leaves a matching validator behind.
+        match = re.search(r'filename="([^"]*)"', res.headers.get("Content-Disposition", ""))
+        meta["url_name"] = match[1] if match else meta.get("url_name", url)
+        meta["validator"] = res.headers.get("ETag") or res.headers.get("Last-Modified")
+        if meta_file is not None:
+            _write_partial_meta(meta_file, meta)
+
+        chunks = res.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE)
+        head = b""
+        if offset == 0:
+            # Google Drive reports errors as small HTML pages; inspect the start of the data.
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= 8192:
+                    break
+            if len(head) == 0:
+                raise IOError("No data received")
+
+            if len(head) < 8192:
+                content_str = head.decode("utf-8", errors="ignore")
+                if "download_warning" in res.headers.get("Set-Cookie", ""):
+                    links = [html.unescape(link) for link in content_str.split('"') if "export=download" in link]
+                    if len(links) == 1:
+                        raise _RedirectDownload("Google Drive virus checker nag", requests.compat.urljoin(url, links[0]))
+                if "Google Drive - Quota exceeded" in content_str:
+                    raise IOError("Google Drive download quota exceeded -- please try again later")
+
+        total = None
+        if "Content-Length" in res.headers and "Content-Encoding" not in res.headers:
+            total = offset + int(res.headers["Content-Length"])
+        progress = _DownloadProgress(verbose, url, offset, total)
+
+        file.write(head)
+        progress.update(len(head))
+        for chunk in chunks:
+            file.write(chunk)
+            progress.update(len(chunk))
+        file.flush()
+        progress.update(0, force=True)
+
+        if total is not None and file.tell() != total:
+            raise IOError("Incomplete download: got %d of %d bytes" % (file.tell(), total))
+
+    return meta["url_name"]
+
+
+def _probe_ranges(session: requests.Session, url: str, meta: dict, partial_file: str) -> bool:
+    """Check whether the URL is large enough for a parallel download and supports Range requests
+    with a validator (ETag or Last-Modified).  Records size and validator in `meta`, resetting a
+    stale parallel partial file."""
+    try:
+        with session.get(url, headers={"Range": "bytes=0-0"}, stream=True) as res:
+            match = re.match(r"bytes 0-0/(\d+)$", res.headers.get("Content-Range", ""))
+            if res.status_code != 206 or not match:
+                return False
+            size = int(match[1])
+            validator = res.headers.get("ETag") or res.headers.get("Last-Modified")
+            name_match = re.search(r'filename="([^"]*)"', res.headers.get("Content-Disposition", ""))
+    except requests.RequestException:
+        return False
+    if validator is None:
+        # Segments can't be tied to one version of the resource, so they
+        # might mix two of them; download as a single stream instead.
+        return False
+
+    if "segment_size" in meta and (meta.get("size") != size or meta.get("validator") != validator):
+        # The resource changed since the partial download started.
+        _remove_files(partial_file)
+        meta.clear()
+    if "segment_size" not in meta:
+        if size < _PARALLEL_MIN_SIZE:
+            return False
+        # A contiguous partial file from a single-stream download of the same
+        # resource counts as a completed prefix; anything else starts over.
+        prefix = 0
+        if os.path.isfile(partial_file):
+            if validator is not None and meta.get("validator") == validator:
+                prefix = os.path.getsize(partial_file)
+            else:
+                _remove_files(partial_file)
+        meta.clear()
+        meta["prefix"] = prefix
+    meta["size"] = size
+    meta["validator"] = validator
+    meta["url_name"] = name_match[1] if name_match else meta.get("url_name", url)
+    return True
+
+
+def _download_parallel(url: str, partial_file: str, meta: dict, meta_file: str, num_connections: int, num_attempts: int, verbose: bool) -> str:
+    """Download the URL as byte-range segments over a pool of keep-alive connections
+    into a preallocated sparse file.  Each segment is retried independently, and
+    completed segments are recorded in `meta` so that an interrupted download resumes."""
+    size = meta["size"]
+    if "segment_size" not in meta:
+        meta["segment_size"] = max(_PARALLEL_MIN_SEGMENT, -(-size // (num_connections * 4)))
+        prefix = meta.pop("prefix", 0)
+        meta["done"] = [i for i in range(-(-size // meta["segment_size"])) if min(size, (i + 1) * meta["segment_size"]) <= prefix]
+    segment_size = meta["segment_size"]
+    num_segments = -(-size // segment_size)
+    done = set(meta["done"])
+    pending = [i for i in range(num_segments) if i not in done]
+
+    # Preallocate; truncate() extends the file sparsely on most file systems.
+    with open(partial_file, "ab") as f:
+        if f.tell() != size:
+            f.truncate(size)
+    _write_partial_meta(meta_file, meta)
+
+    lock = threading.Lock()
+    local = threading.local()
+    sessions = []
+    done_bytes = sum(min(size, (i + 1) * segment_size) - i * segment_size for i in done)
+    progress = _DownloadProgress(verbose, url, done_bytes, size)
+
+    def get_session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            with lock:
+                sessions.append(local.session)
+        return local.session
+
+    def fetch_segment(index: int) -> None:
+        pos = index * segment_size
+        end = min(size, pos + segment_size) - 1
+        for attempts_left in reversed(range(num_attempts)):
+            try:
+                headers = {"Range": "bytes=%d-%d" % (pos, end), "If-Range": meta["validator"]}
+                with get_session().get(url, headers=headers, stream=True) as res:
+                    res.raise_for_status()
+                    if res.status_code != 206:
+                        raise IOError("Server ignored the Range request; the file may have changed")
+                    with open(partial_file, "r+b") as f:
+                        f.seek(pos)
+                        for chunk in res.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                            chunk = chunk[:end + 1 - pos]
+                            f.write(chunk)
+                            pos += len(chunk)
+                            with lock:
+                                progress.update(len(chunk))
+                if pos != end + 1:
+                    raise IOError("Incomplete segment")
+                with lock:
+                    done.add(index)
+                    meta["done"] = sorted(done)
+                    _write_partial_meta(meta_file, meta)
+                return
+            except KeyboardInterrupt:
+                raise
+            except:
+                if not attempts_left:
+                    raise
+                time.sleep(min(0.1 * 2 ** (num_attempts - attempts_left - 1), 5.0))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_connections) as executor:
+            futures = [executor.submit(fetch_segment, index) for index in pending]
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    for other in futures:
+                        other.cancel()
+                    raise future.exception()
+    finally:
+        for session in sessions:
+            session.close()
+
+    progress.update(0, force=True)
+    return meta["url_name"]
@@ -0,0 +1,168 @@
+"""
+Multi-account batch reports for Spotify Reader
+
+Generates a report for every cached OAuth token in a directory. Accounts are
+processed concurrently by a bounded worker pool that shares one rate-limited
+HTTP session; tokens are refreshed proactively before they expire. Reports
+are streamed to disk as they complete, so memory use stays flat no matter
+how many accounts are processed.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metadata import MetadataCache
+from spotify_reader import SpotifyReader
+from transport import ThrottledSession
+
+
+class ReportWriter:
+    """
+    Thread-safe streaming writer for account reports.
+
+    In 'ndjson' mode every report is appended as one line to a single file.
+    In 'json' mode every report is written to <output>/<account>.json.
+    Reports are encoded straight into the file, never built as one string.
+    """
+
+    def __init__(self, output, fmt='ndjson'):
+        if fmt not in ('json', 'ndjson'):
+            raise ValueError(f"Unknown report format: {fmt}")
+        self.output = output
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        self.file = None
+
+        if fmt == 'ndjson':
+            if not output.endswith('.ndjson'):
+                self.output = output + '.ndjson'
+            parent = os.path.dirname(self.output)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self.file = open(self.output, 'w', encoding='utf-8')
+        else:
+            os.makedirs(output, exist_ok=True)
+
+    def write(self, account, report):
+        """Write one account's report."""
+        record = dict(report, account=account)
+        if self.fmt == 'ndjson':
+            with self.lock:
+                json.dump(record, self.file, ensure_ascii=False, separators=(',', ':'))
+                self.file.write('\n')
+                self.file.flush()
+        else:
+            path = os.path.join(self.output, account + '.json')
+            temp_path = path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, path)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_token_files(token_dir):
+    """Yield (account, path) for every token cache file, without listing them all up front."""
+    with os.scandir(token_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                account = os.path.splitext(entry.name)[0].lstrip('.') or entry.name
+                yield account, entry.path
+
+
+def process_account(account, token_path, writer, session, metadata_cache, refresh_margin,
+                    stats_dir=None):
+    """Refresh the account's token if needed, build its report and write it."""
+    reader = SpotifyReader(cache_path=token_path, session=session,
+                           metadata_cache=metadata_cache)
+    if not reader.refresh_token_if_expiring(refresh_margin):
+        raise RuntimeError("no cached token")
+    report = reader.build_report()
+    if stats_dir:
+        stats, _ = reader.sync_listening_stats(os.path.join(stats_dir, account + '.json.gz'),
+                                               raise_errors=True)
+        report['listening_stats'] = stats.summary()
+    writer.write(account, report)
+
+
+def run_batch(token_dir, output, fmt='ndjson', workers=4, refresh_margin=300,
+              progress_every=25, stats_dir=None):
+    """
+    Generate reports for every account with a cached token in `token_dir`.
+
+    Args:
+        token_dir: Directory of spotipy token cache files, one per account
+        output: NDJSON file path or directory for per-account JSON files
+        fmt: 'ndjson' or 'json'
+        workers: Number of accounts processed concurrently
+        refresh_margin: Refresh tokens expiring within this many seconds
+        progress_every: Print progress after this many finished accounts
+        stats_dir: Directory of per-account listening stats to sync, if any
+
+    Returns:
+        Dict with 'ok', 'failed' and 'seconds' totals
+    """
+    print(f"📦 Batch mode: reading tokens from {token_dir}")
+    session = ThrottledSession(
+        rate=float(os.getenv('SPOTIFY_RATE_LIMIT', '10')),
+        max_per_host=int(os.getenv('SPOTIFY_MAX_CONNECTIONS', '8'))
+    )
+    # Batch reports don't enrich, so there is no need to load the cache file
+    metadata_cache = MetadataCache(path=None)
+
+    if stats_dir:
+        os.makedirs(stats_dir, exist_ok=True)
+
+    summary = {'ok': 0, 'failed': 0, 'seconds': 0.0}
+    start = time.monotonic()
+
+    def finish(done):
+        for future in done:
+            account = pending.pop(future)
+            try:
+                future.result()
+                summary['ok'] += 1
+            except Exception as e:
+                summary['failed'] += 1
+                print(f"❌ {account}: {e}")
+            finished = summary['ok'] + summary['failed']
+            if finished % progress_every == 0:
+                elapsed = time.monotonic() - start
+                print(f"🔄 {finished} accounts processed ({finished / elapsed:.1f}/s)")
+
+    with ReportWriter(output, fmt) as writer, ThreadPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of accounts in flight so memory use doesn't
+        # grow with the size of the token directory
+        pending = {}
+        for account, token_path in iter_token_files(token_dir):
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+            future = executor.submit(process_account, account, token_path, writer,
+                                     session, metadata_cache, refresh_margin, stats_dir)
+            pending[future] = account
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finish(done)
+
+    summary['seconds'] = time.monotonic() - start
+    stats = session.stats
+    print("=" * 50)
+    print(f"✨ Batch complete: {summary['ok']} ok, {summary['failed']} failed "
+          f"in {summary['seconds']:.1f}s")
+    print(f"🌐 {stats['requests']} requests, {stats['retries']} retries, "
+          f"{stats['throttle_seconds']:.1f}s throttled")
+    print(f"📄 Reports written to {writer.output}")
+    return summary
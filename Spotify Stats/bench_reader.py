@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of SpotifyReader against the local fake Spotify API.
+
+Generates a seeded catalog and history, then measures metadata enrichment
+of the whole history with a cold and a warm metadata cache, with injected
+latency and 429s so the transport's retries and throttling are exercised.
+
+Usage: python bench_reader.py [plays] [latency_ms] [throttle_rate]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from fake_spotify import FakeSpotifyServer, SyntheticCatalog, SyntheticHistory
+from metadata import MetadataCache
+from spotify_reader import SpotifyReader
+from transport import ThrottledSession
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    n_plays = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+    throttle_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    print("⏱️  SpotifyReader benchmark against the fake Spotify API")
+    print("=" * 50)
+    catalog = timed("generate catalog", lambda: SyntheticCatalog(
+        n_artists=5000, n_albums=15000, n_tracks=100000, seed=1))
+    history = timed(f"generate {n_plays} plays", lambda: SyntheticHistory(
+        catalog, n_plays=n_plays, seed=1))
+    plays = history.plays
+
+    with FakeSpotifyServer(catalog, history, latency=latency, throttle_rate=throttle_rate,
+                           retry_after=0.2) as server, tempfile.TemporaryDirectory() as temp_dir:
+        token_cache = server.write_token_cache(os.path.join(temp_dir, '.cache'))
+        session = ThrottledSession(rate=200, burst=50, max_per_host=16)
+        cache = MetadataCache(os.path.join(temp_dir, 'metadata.json'))
+        reader = SpotifyReader(cache_path=token_cache, session=session,
+                               metadata_cache=cache, api_prefix=server.url)
+
+        print(f"\nServer latency {latency * 1000:.0f} ms, 429 rate {throttle_rate:.0%}")
+        metadata = timed("enrich (cold cache)", lambda: reader.enrich_metadata(plays))
+        cold_requests = server.stats['requests']
+        timed("enrich (warm cache)", lambda: reader.enrich_metadata(plays))
+        warm_requests = server.stats['requests'] - cold_requests
+
+        print(f"\n  unique: {len(metadata['tracks'])} tracks, {len(metadata['artists'])} artists, "
+              f"{len(metadata['albums'])} albums")
+        print(f"  requests: {cold_requests} cold, {warm_requests} warm")
+        print(f"  429s injected: {server.stats['throttled']}, client retries: "
+              f"{session.stats['retries']}, throttled {session.stats['throttle_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the artist/user similarity index on a synthetic catalog.
+
+Builds the top-K index for a large seeded catalog with listening data for
+many users, then measures an incremental update after new plays (checking
+that it matches a full rebuild) and the latency of "artists like X" and
+"users with similar taste" queries.
+Target: queries under 1 ms for 100k artists.
+
+Usage: python bench_similarity.py [artists] [users]
+"""
+
+import itertools
+import random
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from fake_spotify import SyntheticCatalog
+from similarity import SimilarityIndex
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<32} {(time.perf_counter() - start) * 1000:10.1f} ms")
+    return result
+
+
+def main():
+    n_artists = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    print("⏱️  Similarity index benchmark")
+    print("=" * 50)
+    catalog = timed(f"generate {n_artists} artists", lambda: SyntheticCatalog(
+        n_artists=n_artists, n_albums=n_artists, n_tracks=n_artists * 2, n_genres=2000, seed=7))
+    artist_ids = list(catalog.artists)
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(artist_ids))))
+
+    def listening(seed, plays=300):
+        # Zipf-like plays around a random "home" region of the catalog
+        rng = random.Random(seed)
+        offset = rng.randrange(len(artist_ids))
+        picks = rng.choices(range(len(artist_ids)), cum_weights=cum_weights, k=plays)
+        return Counter(artist_ids[(offset + pick) % len(artist_ids)] for pick in picks)
+
+    histories = timed(f"generate {n_users} histories", lambda: [
+        listening(user) for user in range(n_users)])
+
+    index = SimilarityIndex(k=20)
+
+    def load():
+        index.add_artists(catalog.artists.values())
+        for user, counts in enumerate(histories):
+            index.add_listening(f"user_{user}", counts)
+
+    timed("add data", load)
+    timed("full build", index.update)
+
+    new_counts = histories[0] + listening(n_users + 1, plays=50)
+    index.add_listening("user_0", new_counts)
+    dirty = len(index.dirty_artists)
+    timed(f"incremental update ({dirty} dirty)", index.update)
+
+    # The incremental result must match a full rebuild of the same data
+    # (only listening changed, so the rebuild keeps the same genre IDF)
+    incremental = (index.artist_scores.copy(), index.user_scores.copy())
+    timed("full rebuild (check)", lambda: index.update(full=True))
+    mismatched = sum(int((~np.isclose(old, new, atol=1e-5).all(axis=1)).sum())
+                     for old, new in zip(incremental, (index.artist_scores, index.user_scores)))
+    print(f"  rows differing from full rebuild: {mismatched} {'✅' if not mismatched else '❌'}")
+
+    rng = random.Random(0)
+    query_artists = rng.sample(index.artist_ids, 1000)
+    user_ids = rng.sample(index.user_ids, min(1000, len(index.user_ids)))
+
+    start = time.perf_counter()
+    for artist_id in query_artists:
+        index.similar_artists(artist_id)
+    artist_us = (time.perf_counter() - start) / len(query_artists) * 1e6
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        index.similar_users(user_id)
+    user_us = (time.perf_counter() - start) / len(user_ids) * 1e6
+
+    print(f"\n  similar_artists query: {artist_us:8.1f} µs")
+    print(f"  similar_users query:   {user_us:8.1f} µs")
+    print(f"  Target:                {1000:8.1f} µs "
+          f"{'✅' if max(artist_us, user_us) < 1000 else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the Spotify Reader CLI.
+
+Measures:
+1. The `python -X importtime` breakdown of importing spotify_reader
+2. Wall time of `spotify_reader.py --help`
+3. Wall time to first output of a cached run (valid token in .cache)
+
+The cached run is stopped as soon as its first line is printed, so no
+network access or Spotify credentials are needed. Target: < 100 ms.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, 'spotify_reader.py')
+TARGET_MS = 100.0
+
+
+def import_breakdown(top=10):
+    """Return the slowest imports (cumulative microseconds) of spotify_reader."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import spotify_reader'],
+        cwd=HERE, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def time_help(runs):
+    """Median wall time of --help in milliseconds."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, '--help'], cwd=HERE,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def time_first_output(runs):
+    """Median wall time until a cached run prints its first line, in milliseconds."""
+    samples = []
+    env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONPATH=HERE)
+    env.pop('SPOTIPY_CLIENT_ID', None)
+    env.pop('SPOTIPY_CLIENT_SECRET', None)
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        with open(os.path.join(run_dir, '.cache'), 'w') as f:
+            json.dump({
+                'access_token': 'benchmark-token',
+                'token_type': 'Bearer',
+                'expires_in': 3600,
+                'expires_at': int(time.time()) + 3600,
+                'refresh_token': 'benchmark-refresh',
+                'scope': 'user-read-recently-played user-top-read',
+            }, f)
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, SCRIPT], cwd=run_dir, env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            proc.stdout.readline()
+            samples.append((time.perf_counter() - start) * 1000)
+            proc.kill()
+            proc.wait()
+    return sorted(samples)[len(samples) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    print("⏱️  Spotify Reader startup benchmark")
+    print("=" * 50)
+
+    print("\nSlowest imports of spotify_reader (cumulative):")
+    for cumulative_us, name in import_breakdown():
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    help_ms = time_help(runs)
+    first_ms = time_first_output(runs)
+    print(f"\n--help:                     {help_ms:6.1f} ms (median of {runs})")
+    print(f"Cached run, first output:   {first_ms:6.1f} ms (median of {runs})")
+    print(f"Target:                     {TARGET_MS:6.1f} ms "
+          f"{'✅' if first_ms < TARGET_MS else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
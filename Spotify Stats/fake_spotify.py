@@ -0,0 +1,436 @@
+"""
+Local fake Spotify Web API for tests, demos and benchmarks
+
+Serves the endpoints SpotifyReader uses from a seeded synthetic catalog and
+listening history of configurable size:
+
+    GET /v1/me
+    GET /v1/me/top/tracks            (limit, offset, time_range)
+    GET /v1/me/top/artists           (limit, offset, time_range)
+    GET /v1/me/player/recently-played (limit, before, after cursors)
+    GET /v1/artists?ids=...  /v1/tracks?ids=...  /v1/albums?ids=...
+    GET /v1/artists/{id}     /v1/tracks/{id}     /v1/albums/{id}
+
+Latency, 429 responses (with Retry-After) and ETag/If-None-Match handling
+can be injected so caching, concurrency and sync paths can be exercised
+offline at realistic scale. Point SpotifyReader at it with `api_prefix`
+(or SPOTIFY_API_PREFIX) and a token cache written by `write_token_cache`.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+GENRE_WORDS = ['indie', 'dream', 'synth', 'post', 'art', 'alt', 'neo', 'acid',
+               'dark', 'garage', 'lo-fi', 'nu', 'chamber', 'math', 'soft', 'hyper']
+GENRE_BASES = ['pop', 'rock', 'folk', 'jazz', 'soul', 'punk', 'house', 'techno',
+               'hip hop', 'r&b', 'metal', 'country', 'ambient', 'disco', 'blues']
+NAME_WORDS = ['Blue', 'Night', 'Golden', 'Echo', 'Velvet', 'Paper', 'Silver', 'Wild',
+              'Neon', 'River', 'Glass', 'Static', 'Honey', 'Ghost', 'Cold', 'Summer',
+              'Heart', 'Moon', 'Fire', 'Garden', 'Signal', 'Ocean', 'Stone', 'Light']
+
+# Spotify's time ranges: roughly 4 weeks, 6 months and all of the history
+TIME_RANGES = {'short_term': 28, 'medium_term': 182, 'long_term': None}
+
+BATCH_LIMITS = {'artists': 50, 'tracks': 50, 'albums': 20}
+
+
+def _spotify_id(rng):
+    """Random 22-character base62 ID, like Spotify's."""
+    alphabet = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return ''.join(rng.choice(alphabet) for _ in range(22))
+
+
+def _name(rng, words):
+    return ' '.join(rng.choice(NAME_WORDS) for _ in range(words))
+
+
+def _iso(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc) \
+        .strftime('%Y-%m-%dT%H:%M:%S.') + f"{timestamp_ms % 1000:03d}Z"
+
+
+class SyntheticCatalog:
+    """
+    Seeded catalog of artists, albums and tracks shaped like Spotify objects.
+
+    Args:
+        n_artists: Number of artists
+        n_albums: Number of albums (each belongs to one artist)
+        n_tracks: Number of tracks (each belongs to one album)
+        n_genres: Size of the genre vocabulary
+        seed: Random seed; the same seed always yields the same catalog
+    """
+
+    def __init__(self, n_artists=1000, n_albums=3000, n_tracks=20000, n_genres=300, seed=0):
+        rng = random.Random(seed)
+        genres = sorted({f"{rng.choice(GENRE_WORDS)} {rng.choice(GENRE_BASES)}"
+                         for _ in range(n_genres * 4)})[:n_genres]
+
+        self.artists = {}
+        for _ in range(n_artists):
+            artist_id = _spotify_id(rng)
+            self.artists[artist_id] = {
+                'id': artist_id,
+                'type': 'artist',
+                'uri': f"spotify:artist:{artist_id}",
+                'name': _name(rng, rng.randint(1, 3)),
+                'genres': rng.sample(genres, rng.randint(0, min(4, len(genres)))),
+                'followers': {'href': None, 'total': int(rng.paretovariate(1.2) * 1000)},
+                'popularity': rng.randint(0, 100),
+            }
+        artist_ids = list(self.artists)
+
+        self.albums = {}
+        for _ in range(n_albums):
+            album_id = _spotify_id(rng)
+            artist = self.artists[rng.choice(artist_ids)]
+            self.albums[album_id] = {
+                'id': album_id,
+                'type': 'album',
+                'uri': f"spotify:album:{album_id}",
+                'name': _name(rng, rng.randint(1, 4)),
+                'album_type': rng.choice(['album', 'single', 'compilation']),
+                'artists': [self._simplified(artist)],
+                'release_date': f"{rng.randint(1960, 2024)}-{rng.randint(1, 12):02d}-01",
+                'genres': [],
+                'popularity': rng.randint(0, 100),
+            }
+        album_ids = list(self.albums)
+
+        self.tracks = {}
+        for _ in range(n_tracks):
+            track_id = _spotify_id(rng)
+            album = self.albums[rng.choice(album_ids)]
+            artists = [album['artists'][0]]
+            if rng.random() < 0.15:
+                artists.append(self._simplified(self.artists[rng.choice(artist_ids)]))
+            self.tracks[track_id] = {
+                'id': track_id,
+                'type': 'track',
+                'uri': f"spotify:track:{track_id}",
+                'name': _name(rng, rng.randint(1, 4)),
+                'artists': artists,
+                'album': {key: album[key] for key in ('id', 'type', 'uri', 'name', 'album_type',
+                                                      'artists', 'release_date')},
+                'duration_ms': rng.randint(90_000, 420_000),
+                'explicit': rng.random() < 0.2,
+                'popularity': rng.randint(0, 100),
+            }
+
+    @staticmethod
+    def _simplified(artist):
+        return {key: artist[key] for key in ('id', 'type', 'uri', 'name')}
+
+
+class SyntheticHistory:
+    """
+    Seeded listening history over a catalog, newest play first.
+
+    Track choice follows a Zipf-like distribution so a few tracks dominate,
+    as in real listening data.
+
+    Args:
+        catalog: SyntheticCatalog to draw tracks from
+        n_plays: Number of plays
+        days: Span of the history, ending now
+        seed: Random seed
+    """
+
+    def __init__(self, catalog, n_plays=10000, days=365, seed=0, now=None):
+        rng = random.Random(seed)
+        track_ids = list(catalog.tracks)
+        rng.shuffle(track_ids)
+        weights = [1.0 / (rank + 1) for rank in range(len(track_ids))]
+
+        now_ms = int((now if now is not None else time.time()) * 1000)
+        span_ms = days * 86_400_000
+        timestamps = sorted((now_ms - rng.randrange(span_ms) for _ in range(n_plays)), reverse=True)
+        chosen = rng.choices(track_ids, weights=weights, k=n_plays)
+
+        self.plays = [
+            {
+                'track': catalog.tracks[track_id],
+                'played_at': _iso(timestamp),
+                'played_at_ms': timestamp,
+                'context': None,
+            }
+            for track_id, timestamp in zip(chosen, timestamps)
+        ]
+        self.now_ms = now_ms
+
+
+class FakeSpotifyServer:
+    """
+    Threaded HTTP server that imitates the Spotify Web API.
+
+    Args:
+        catalog: SyntheticCatalog (a small default one if None)
+        history: SyntheticHistory (generated from the catalog if None)
+        latency: Seconds added to every response
+        throttle_rate: Probability of answering a request with 429
+        retry_after: Retry-After seconds sent with injected 429s
+        seed: Seed for injected failures
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, catalog=None, history=None, latency=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=0, port=0):
+        self.catalog = catalog or SyntheticCatalog(n_artists=50, n_albums=120, n_tracks=500)
+        self.history = history or SyntheticHistory(self.catalog, n_plays=2000)
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.user = {
+            'id': 'fake_user',
+            'display_name': 'Fake User',
+            'type': 'user',
+            'uri': 'spotify:user:fake_user',
+            'followers': {'href': None, 'total': 0},
+        }
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._top = {time_range: self._rank(days) for time_range, days in TIME_RANGES.items()}
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """API prefix to hand to SpotifyReader."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def write_token_cache(self, path, expires_in=3600):
+        """Write a spotipy token cache file accepted by this server."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'access_token': 'fake-access-token',
+                'token_type': 'Bearer',
+                'expires_in': expires_in,
+                'expires_at': int(time.time()) + expires_in,
+                'refresh_token': 'fake-refresh-token',
+                'scope': 'user-read-recently-played user-top-read',
+            }, f)
+        return path
+
+    def _rank(self, days):
+        """Rank tracks and artists by play count within the last `days` days."""
+        cutoff = self.history.now_ms - days * 86_400_000 if days else 0
+        track_counts = Counter()
+        artist_counts = Counter()
+        for play in self.history.plays:
+            if play['played_at_ms'] < cutoff:
+                break  # plays are newest first
+            track_counts[play['track']['id']] += 1
+            for artist in play['track']['artists']:
+                artist_counts[artist['id']] += 1
+        return {
+            'tracks': [self.catalog.tracks[i] for i, _ in track_counts.most_common()],
+            'artists': [self.catalog.artists[i] for i, _ in artist_counts.most_common()],
+        }
+
+    # Endpoint implementations; each returns (status, body)
+
+    def _paging(self, href, items, query):
+        limit = min(int(query.get('limit', 20)), 50)
+        offset = int(query.get('offset', 0))
+        page = items[offset:offset + limit]
+        next_offset = offset + limit
+        return 200, {
+            'href': href,
+            'items': page,
+            'limit': limit,
+            'offset': offset,
+            'total': len(items),
+            'next': f"{href}?limit={limit}&offset={next_offset}" if next_offset < len(items) else None,
+            'previous': f"{href}?limit={limit}&offset={max(0, offset - limit)}" if offset else None,
+        }
+
+    def _top_items(self, kind, href, query):
+        time_range = query.get('time_range', 'medium_term')
+        if time_range not in self._top:
+            return 400, {'error': {'status': 400, 'message': 'Invalid time range'}}
+        return self._paging(href, self._top[time_range][kind], query)
+
+    def _recently_played(self, href, query):
+        limit = min(int(query.get('limit', 20)), 50)
+        plays = self.history.plays
+        if 'after' in query:
+            after = int(query['after'])
+            # newest-first list: take the `limit` oldest plays newer than `after`
+            newer = [p for p in plays if p['played_at_ms'] > after]
+            page = newer[-limit:]
+        else:
+            before = int(query['before']) if 'before' in query else None
+            page = []
+            for play in plays:
+                if before is None or play['played_at_ms'] < before:
+                    page.append(play)
+                    if len(page) == limit:
+                        break
+        items = [{key: play[key] for key in ('track', 'played_at', 'context')} for play in page]
+        cursors = None
+        next_url = None
+        if page:
+            cursors = {'after': str(page[0]['played_at_ms']), 'before': str(page[-1]['played_at_ms'])}
+            if page[-1] is not plays[-1]:
+                next_url = f"{href}?before={cursors['before']}&limit={limit}"
+        return 200, {'href': href, 'items': items, 'limit': limit, 'next': next_url,
+                     'cursors': cursors}
+
+    def _batch(self, kind, query):
+        ids = [i for i in query.get('ids', '').split(',') if i]
+        if len(ids) > BATCH_LIMITS[kind]:
+            return 400, {'error': {'status': 400, 'message': 'Too many ids requested'}}
+        table = getattr(self.catalog, kind)
+        return 200, {kind: [table.get(i) for i in ids]}
+
+    def _single(self, kind, item_id):
+        item = getattr(self.catalog, kind).get(item_id)
+        if item is None:
+            return 404, {'error': {'status': 404, 'message': 'Non existing id'}}
+        return 200, item
+
+    def route(self, path, query):
+        """Dispatch a GET request to the matching endpoint."""
+        href = f"{self.url.rstrip('/')}{path[len('/v1'):]}"
+        parts = path.strip('/').split('/')
+        if parts[0] != 'v1':
+            return 404, {'error': {'status': 404, 'message': 'Service not found'}}
+        parts = parts[1:]
+
+        if parts == ['me']:
+            return 200, self.user
+        if parts in (['me', 'top', 'tracks'], ['me', 'top', 'artists']):
+            return self._top_items(parts[2], href, query)
+        if parts == ['me', 'player', 'recently-played']:
+            return self._recently_played(href, query)
+        if len(parts) == 1 and parts[0] in BATCH_LIMITS:
+            return self._batch(parts[0], query)
+        if len(parts) == 2 and parts[0] in BATCH_LIMITS:
+            return self._single(parts[0], parts[1])
+        return 404, {'error': {'status': 404, 'message': 'Service not found'}}
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _should_throttle(self):
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.throttle_rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                server.count('requests')
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    body = json.dumps({'error': {'status': 401, 'message': 'No token provided'}})
+                    self._send(401, body.encode(), {'Content-Type': 'application/json'})
+                    return
+
+                if server._should_throttle():
+                    server.count('throttled')
+                    self._send(429, b'', {'Retry-After': str(server.retry_after)})
+                    return
+
+                url = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    status, payload = server.route(url.path, query)
+                except ValueError:
+                    status, payload = 400, {'error': {'status': 400, 'message': 'Bad request'}}
+
+                body = json.dumps(payload, separators=(',', ':')).encode()
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    server.count('not_modified')
+                    self._send(304, b'', {'ETag': etag})
+                    return
+                self._send(status, body, {'Content-Type': 'application/json; charset=utf-8',
+                                          'ETag': etag})
+
+        return Handler
+
+
+def main():
+    """Run a standalone fake server until interrupted."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local fake Spotify Web API.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--albums', type=int, default=3000)
+    parser.add_argument('--tracks', type=int, default=20000)
+    parser.add_argument('--plays', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per request")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--token-cache', metavar='PATH', help="write a matching token cache file")
+    args = parser.parse_args()
+
+    catalog = SyntheticCatalog(args.artists, args.albums, args.tracks, seed=args.seed)
+    history = SyntheticHistory(catalog, n_plays=args.plays, seed=args.seed)
+    server = FakeSpotifyServer(catalog, history, latency=args.latency,
+                               throttle_rate=args.throttle_rate, seed=args.seed, port=args.port)
+    if args.token_cache:
+        server.write_token_cache(args.token_cache)
+
+    print(f"🎧 Fake Spotify API listening on {server.url}")
+    print(f"   export SPOTIFY_API_PREFIX={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Goodbye!")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Incremental listening statistics for Spotify Reader
+
+Keeps running aggregates over recently-played history and folds in each new
+batch of plays in time proportional to the batch size:
+
+- plays and listening time by hour of day and weekday
+- per-artist and per-track play counts over sliding 7/30/365-day windows
+- current and longest listening streaks (consecutive days with plays)
+- exponentially decayed "currently obsessed" scores
+
+Only per-day buckets, decayed scores and a few counters are persisted (as
+gzipped JSON); the sliding windows are rebuilt from the buckets on load.
+"""
+
+import gzip
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+WINDOWS = (7, 30, 365)
+DAY_MS = 86_400_000
+HALF_LIFE_DAYS = 7.0
+MIN_SCORE = 0.01  # decayed scores below this are dropped from the state
+STATE_VERSION = 1
+
+
+def parse_played_at(value):
+    """Convert Spotify's ISO 8601 `played_at` into epoch milliseconds."""
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+class ListeningStats:
+    """
+    Running aggregates over a user's listening history.
+
+    Args:
+        tz_offset_minutes: Offset from UTC used for hour-of-day, weekday and
+            day boundaries
+        half_life_days: Half-life of the "currently obsessed" scores
+    """
+
+    def __init__(self, tz_offset_minutes=0, half_life_days=HALF_LIFE_DAYS):
+        self.tz_offset_ms = tz_offset_minutes * 60_000
+        self.half_life_ms = half_life_days * DAY_MS
+
+        self.cursor = 0  # played_at (ms) of the newest play folded in
+        self.hour_plays = [0] * 24
+        self.hour_ms = [0] * 24
+        self.weekday_plays = [0] * 7  # Monday is 0
+        self.weekday_ms = [0] * 7
+
+        # day number -> {'artists': Counter, 'tracks': Counter, 'plays': n, 'ms': n}
+        self.days = {}
+        self.today = None  # newest day seen; windows end here
+        self.windows = {w: {'artists': Counter(), 'tracks': Counter()} for w in WINDOWS}
+
+        self.last_day = None
+        self.current_streak = 0
+        self.longest_streak = 0
+
+        # id -> [score, last update in ms]
+        self.scores = {'artists': {}, 'tracks': {}}
+        self.names = {}
+
+    # Folding in new plays
+
+    def fold(self, plays):
+        """
+        Fold a batch of recently-played items into the aggregates.
+
+        Plays at or before the cursor are skipped, so overlapping batches
+        can be folded safely.
+
+        Returns:
+            Number of new plays folded in
+        """
+        batch = []
+        for play in plays:
+            played_at = parse_played_at(play['played_at'])
+            if played_at > self.cursor:
+                batch.append((played_at, play['track']))
+        batch.sort(key=lambda item: item[0])
+
+        for played_at, track in batch:
+            self._add(played_at, track)
+        return len(batch)
+
+    def _add(self, played_at, track):
+        local_ms = played_at + self.tz_offset_ms
+        day = local_ms // DAY_MS
+        hour = (local_ms % DAY_MS) // 3_600_000
+        weekday = (day + 3) % 7  # 1970-01-01 was a Thursday
+        duration = track.get('duration_ms', 0)
+        track_id = track['id']
+        artist_ids = [artist['id'] for artist in track['artists'] if artist.get('id')]
+
+        self.hour_plays[hour] += 1
+        self.hour_ms[hour] += duration
+        self.weekday_plays[weekday] += 1
+        self.weekday_ms[weekday] += duration
+
+        if self.today is None or day > self.today:
+            self._advance(day)
+
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = {'artists': Counter(), 'tracks': Counter(), 'plays': 0, 'ms': 0}
+        bucket['plays'] += 1
+        bucket['ms'] += duration
+        bucket['tracks'][track_id] += 1
+        for artist_id in artist_ids:
+            bucket['artists'][artist_id] += 1
+
+        for window, counters in self.windows.items():
+            if day > self.today - window:
+                counters['tracks'][track_id] += 1
+                for artist_id in artist_ids:
+                    counters['artists'][artist_id] += 1
+
+        self._update_streak(day)
+        self._bump('tracks', track_id, played_at)
+        for artist_id in artist_ids:
+            self._bump('artists', artist_id, played_at)
+
+        self.names[track_id] = track['name']
+        for artist in track['artists']:
+            if artist.get('id'):
+                self.names[artist['id']] = artist['name']
+        self.cursor = played_at
+
+    def _advance(self, day):
+        """Move the end of the sliding windows to `day`, expiring old buckets."""
+        previous = self.today
+        self.today = day
+        if previous is None:
+            return
+
+        for window, counters in self.windows.items():
+            # Days that were inside the window before but not any more
+            first_expired = previous - window + 1
+            last_expired = min(previous, day - window)
+            if last_expired - first_expired > len(self.days):
+                expired = [d for d in self.days if first_expired <= d <= last_expired]
+            else:
+                expired = range(first_expired, last_expired + 1)
+            for expired_day in expired:
+                bucket = self.days.get(expired_day)
+                if bucket is not None:
+                    counters['artists'].subtract(bucket['artists'])
+                    counters['tracks'].subtract(bucket['tracks'])
+            if last_expired >= first_expired:
+                # Counter.subtract keeps zero entries; drop them
+                for kind in ('artists', 'tracks'):
+                    counter = counters[kind]
+                    for key in [k for k, v in counter.items() if v <= 0]:
+                        del counter[key]
+
+        oldest_kept = day - max(WINDOWS)
+        for old_day in [d for d in self.days if d <= oldest_kept]:
+            del self.days[old_day]
+
+    def _update_streak(self, day):
+        if self.last_day == day:
+            return
+        if self.last_day is not None and day == self.last_day + 1:
+            self.current_streak += 1
+        else:
+            self.current_streak = 1
+        self.last_day = day
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+
+    def _decayed(self, score, since_ms, now_ms):
+        return score * math.pow(2.0, -(now_ms - since_ms) / self.half_life_ms)
+
+    def _bump(self, kind, item_id, played_at):
+        entry = self.scores[kind].get(item_id)
+        if entry is None:
+            self.scores[kind][item_id] = [1.0, played_at]
+        else:
+            entry[0] = self._decayed(entry[0], entry[1], played_at) + 1.0
+            entry[1] = played_at
+
+    # Queries
+
+    def top(self, kind, window, limit=10, now_ms=None):
+        """
+        Top artists or tracks by play count in a 7/30/365-day window ending
+        at `now_ms` (the current time by default).
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        now_day = (now_ms + self.tz_offset_ms) // DAY_MS
+        counter = self.windows[window][kind]
+        if self.today is not None and now_day > self.today:
+            # The stored window ends at the newest play; drop the days that
+            # have fallen out of it since then
+            first_expired = self.today - window + 1
+            last_expired = min(self.today, now_day - window)
+            if last_expired >= first_expired:
+                counter = Counter(counter)
+                for day in range(first_expired, last_expired + 1):
+                    bucket = self.days.get(day)
+                    if bucket is not None:
+                        counter.subtract(bucket[kind])
+                counter = +counter  # drop zero counts
+        return [(item_id, self.names.get(item_id, item_id), count)
+                for item_id, count in counter.most_common(limit)]
+
+    def obsessions(self, kind, now_ms=None, limit=5):
+        """Artists or tracks with the highest decayed play scores right now."""
+        now_ms = now_ms if now_ms is not None else self.cursor
+        scored = [(self._decayed(score, since, now_ms), item_id)
+                  for item_id, (score, since) in self.scores[kind].items()]
+        scored.sort(reverse=True)
+        return [(item_id, self.names.get(item_id, item_id), round(score, 2))
+                for score, item_id in scored[:limit]]
+
+    def streaks(self, now_ms=None):
+        """Current and longest streaks of consecutive listening days."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        today = (now_ms + self.tz_offset_ms) // DAY_MS
+        alive = self.last_day is not None and self.last_day >= today - 1
+        return {'current': self.current_streak if alive else 0, 'longest': self.longest_streak}
+
+    def summary(self, limit=5, now_ms=None):
+        """Compact, JSON-serializable summary of every aggregate."""
+        return {
+            'plays_by_hour': list(self.hour_plays),
+            'ms_by_hour': list(self.hour_ms),
+            'plays_by_weekday': list(self.weekday_plays),
+            'ms_by_weekday': list(self.weekday_ms),
+            'top_artists': {str(w): self.top('artists', w, limit, now_ms) for w in WINDOWS},
+            'top_tracks': {str(w): self.top('tracks', w, limit, now_ms) for w in WINDOWS},
+            'streaks': self.streaks(now_ms),
+            'obsessed_artists': self.obsessions('artists', now_ms, limit),
+            'obsessed_tracks': self.obsessions('tracks', now_ms, limit),
+        }
+
+    # Persistence
+
+    def to_state(self):
+        """Compact, JSON-serializable state (windows are derived, not stored)."""
+        now_ms = self.cursor
+        scores = {
+            kind: {item_id: [round(score, 4), since] for item_id, (score, since) in entries.items()
+                   if self._decayed(score, since, now_ms) >= MIN_SCORE}
+            for kind, entries in self.scores.items()
+        }
+        referenced = set(scores['artists']) | set(scores['tracks'])
+        for bucket in self.days.values():
+            referenced.update(bucket['artists'])
+            referenced.update(bucket['tracks'])
+
+        return {
+            'version': STATE_VERSION,
+            'tz_offset_ms': self.tz_offset_ms,
+            'half_life_ms': self.half_life_ms,
+            'cursor': self.cursor,
+            'hour': [self.hour_plays, self.hour_ms],
+            'weekday': [self.weekday_plays, self.weekday_ms],
+            'today': self.today,
+            'days': {str(day): [bucket['plays'], bucket['ms'], dict(bucket['artists']),
+                                dict(bucket['tracks'])]
+                     for day, bucket in self.days.items()},
+            'streak': [self.last_day, self.current_streak, self.longest_streak],
+            'scores': scores,
+            'names': {item_id: name for item_id, name in self.names.items() if item_id in referenced},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild aggregates from `to_state()` output."""
+        if state.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported listening stats version: {state.get('version')}")
+        stats = cls()
+        stats.tz_offset_ms = state['tz_offset_ms']
+        stats.half_life_ms = state['half_life_ms']
+        stats.cursor = state['cursor']
+        stats.hour_plays, stats.hour_ms = state['hour']
+        stats.weekday_plays, stats.weekday_ms = state['weekday']
+        stats.today = state['today']
+        stats.last_day, stats.current_streak, stats.longest_streak = state['streak']
+        stats.scores = state['scores']
+        stats.names = state['names']
+
+        for day, (plays, ms, artists, tracks) in state['days'].items():
+            day = int(day)
+            bucket = {'artists': Counter(artists), 'tracks': Counter(tracks), 'plays': plays, 'ms': ms}
+            stats.days[day] = bucket
+            for window, counters in stats.windows.items():
+                if day > stats.today - window:
+                    counters['artists'].update(bucket['artists'])
+                    counters['tracks'].update(bucket['tracks'])
+        return stats
+
+    def save(self, path):
+        """Write the state to a gzipped JSON file atomically."""
+        temp_path = path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_state(), f, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load state from `path`, or start empty if the file doesn't exist."""
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls.from_state(json.load(f))
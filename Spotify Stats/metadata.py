@@ -0,0 +1,163 @@
+"""
+Metadata enrichment for Spotify Reader
+
+Collects every unique artist, track and album ID referenced by a dataset
+(top tracks, top artists or recently-played history), skips IDs that are
+already in the local metadata cache and fetches the rest through Spotify's
+batch endpoints. Enriching 10k plays takes a few dozen requests instead of
+one request per play.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of IDs accepted by each batch endpoint
+BATCH_LIMITS = {
+    'artists': 50,
+    'tracks': 50,
+    'albums': 20,
+}
+
+DEFAULT_CACHE_PATH = '.metadata_cache.json'
+
+
+class MetadataCache:
+    """Local JSON cache of full artist/track/album objects keyed by Spotify ID."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.data = {kind: {} for kind in BATCH_LIMITS}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Load cached objects from disk, ignoring a missing or corrupt file."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        for kind in BATCH_LIMITS:
+            self.data[kind].update(stored.get(kind, {}))
+
+    def save(self):
+        """Write the cache to disk if anything changed since the last save."""
+        if not self.path or not self._dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+    def get(self, kind, item_id):
+        """Return the cached object for an ID, or None."""
+        return self.data[kind].get(item_id)
+
+    def missing(self, kind, ids):
+        """Return the IDs that are not cached yet, in a stable order."""
+        cached = self.data[kind]
+        return sorted(item_id for item_id in ids if item_id not in cached)
+
+    def update(self, kind, items):
+        """Store full objects returned by the API."""
+        for item in items:
+            if item and item.get('id'):
+                self.data[kind][item['id']] = item
+                self._dirty = True
+
+
+def collect_ids(items):
+    """
+    Collect unique artist, track and album IDs from a dataset.
+
+    Args:
+        items: Tracks, artists or recently-played entries ({'track': ...})
+
+    Returns:
+        Dict mapping 'artists', 'tracks' and 'albums' to sets of IDs
+    """
+    ids = {kind: set() for kind in BATCH_LIMITS}
+
+    for item in items:
+        if not item:
+            continue
+        # Recently-played history wraps the track in a play object
+        if 'track' in item and isinstance(item['track'], dict):
+            item = item['track']
+
+        item_type = item.get('type')
+        if item_type == 'artist':
+            if item.get('id'):
+                ids['artists'].add(item['id'])
+            continue
+
+        if item.get('id'):
+            ids['tracks'].add(item['id'])
+        for artist in item.get('artists') or []:
+            if artist.get('id'):
+                ids['artists'].add(artist['id'])
+        album = item.get('album') or {}
+        if album.get('id'):
+            ids['albums'].add(album['id'])
+
+    return ids
+
+
+def _fetch_batch(sp, kind, batch):
+    """Fetch one batch of IDs from the matching batch endpoint."""
+    endpoint = getattr(sp, kind)
+    return endpoint(batch)[kind]
+
+
+def enrich(sp, items, cache=None, max_workers=4):
+    """
+    Fetch full metadata for every artist, track and album in a dataset.
+
+    Args:
+        sp: Authenticated spotipy.Spotify client
+        items: Tracks, artists or recently-played entries
+        cache: MetadataCache to read from and update (in-memory if None)
+        max_workers: Number of batch requests to run in parallel
+
+    Returns:
+        Dict mapping 'artists', 'tracks' and 'albums' to {id: object}.
+        IDs from batches that failed are missing from the result.
+    """
+    if cache is None:
+        cache = MetadataCache(path=None)
+
+    ids = collect_ids(items)
+
+    # Split the uncached IDs into batches sized for each endpoint
+    batches = []
+    for kind, limit in BATCH_LIMITS.items():
+        missing = cache.missing(kind, ids[kind])
+        for start in range(0, len(missing), limit):
+            batches.append((kind, missing[start:start + limit]))
+
+    if batches:
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [(kind, executor.submit(_fetch_batch, sp, kind, batch))
+                           for kind, batch in batches]
+                for kind, future in futures:
+                    try:
+                        cache.update(kind, future.result())
+                    except Exception as e:
+                        failed.append(e)
+        finally:
+            # Keep whatever the successful batches fetched
+            cache.save()
+        if failed:
+            print(f"⚠️  {len(failed)} of {len(batches)} metadata batches failed: {failed[0]}")
+
+    return {
+        kind: {item_id: cache.get(kind, item_id) for item_id in ids[kind]
+               if cache.get(kind, item_id) is not None}
+        for kind in BATCH_LIMITS
+    }
@@ -0,0 +1,416 @@
+"""
+Artist and user similarity index for Spotify Reader
+
+Encodes every artist as a sparse TF-IDF genre vector concatenated with a
+listening co-occurrence vector (its play counts across users), and every
+user as their artist play counts plus the resulting genre profile. Cosine
+similarities are computed with batched sparse matrix products and the top K
+neighbours of every artist and user are precomputed, so "artists like X" and
+"users with similar taste" queries are array lookups.
+
+New artists and listening data mark rows dirty; `update()` recomputes the
+dirty rows, plus every row in which a dirty neighbour's score fell, and
+merges the dirty rows' new scores into everyone else's neighbour lists,
+falling back to a full rebuild when much of the data has changed. Genre
+IDF weights are recomputed on every full rebuild and kept between them
+(new genres get theirs when first indexed), so an incremental update
+gives the same result as a full rebuild with the IDF of the last one;
+`update(full=True)` gives the same result as indexing everything at once.
+
+Example:
+    index = SimilarityIndex(k=20)
+    index.add_artists(top_artists)
+    index.add_listening('user_1', stats.windows[365]['artists'])
+    index.update()
+    index.similar_artists(artist_id)
+"""
+
+import json
+
+import numpy as np
+import scipy.sparse as sp
+
+# Memory budget for one dense block of similarity scores
+BLOCK_BYTES = 64 << 20
+
+
+def _normalize_rows(matrix):
+    """L2-normalize the rows of a sparse matrix (zero rows stay zero)."""
+    matrix = sp.csr_matrix(matrix, dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms).dot(matrix), dtype=np.float32)
+
+
+def _select_top_k(candidate_ids, candidate_scores, k):
+    """Pick the k best candidates per row, sorted by descending score."""
+    if candidate_scores.shape[1] > k:
+        part = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+        candidate_ids = np.take_along_axis(candidate_ids, part, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, part, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return (np.take_along_axis(candidate_ids, order, axis=1).astype(np.int32),
+            np.take_along_axis(candidate_scores, order, axis=1).astype(np.float32))
+
+
+def top_k(features, rows, k, block_bytes=BLOCK_BYTES):
+    """
+    Exact top-k cosine neighbours of the given rows of a normalized matrix.
+
+    Rows are processed in blocks sized so that one dense block of scores
+    fits in `block_bytes`.
+
+    Returns:
+        (neighbors, scores) arrays of shape (len(rows), k)
+    """
+    n = features.shape[0]
+    rows = np.asarray(rows, dtype=np.int64)
+    neighbors = np.zeros((len(rows), k), dtype=np.int32)
+    scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+    if n < 2 or not len(rows):
+        return neighbors, scores
+
+    transposed = features.T.tocsr()
+    block = max(1, block_bytes // (4 * n))
+    width = min(k, n)
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        block_scores = (features[block_rows] @ transposed).toarray().astype(np.float32)
+        block_scores[np.arange(len(block_rows)), block_rows] = -np.inf  # not your own neighbour
+        ids = np.broadcast_to(np.arange(n, dtype=np.int32), block_scores.shape)
+        best_ids, best_scores = _select_top_k(ids, block_scores, width)
+        neighbors[start:start + len(block_rows), :width] = best_ids
+        scores[start:start + len(block_rows), :width] = best_scores
+    return neighbors, scores
+
+
+def merge_dirty(features, neighbors, scores, dirty, block_bytes=BLOCK_BYTES):
+    """
+    Update every row's top-k list after the rows in `dirty` changed.
+
+    Neighbours that are dirty have stale scores and are dropped; the new
+    scores against every dirty row are computed in blocks and merged in.
+    That is exact for a row unless one of its dirty neighbours scores lower
+    than before: a clean candidate just outside the list may then belong in
+    it. Those rows are returned as `stale`; they, and the dirty rows
+    themselves, must be recomputed with `top_k` afterwards.
+
+    Returns:
+        (neighbors, scores, stale rows)
+    """
+    n, k = neighbors.shape
+    dirty = np.asarray(sorted(dirty), dtype=np.int64)
+    listed_dirty = np.isin(neighbors, dirty) & np.isfinite(scores)
+    pair_rows, pair_slots = np.nonzero(listed_dirty)
+    pair_scores = np.asarray(features[pair_rows].multiply(
+        features[neighbors[pair_rows, pair_slots]]).sum(axis=1)).ravel()
+    stale = np.unique(pair_rows[pair_scores < scores[pair_rows, pair_slots]])
+
+    scores = np.where(listed_dirty, -np.inf, scores).astype(np.float32)
+    transposed = features.T.tocsr()
+    all_rows = np.arange(n)
+
+    block = max(1, block_bytes // (4 * n))
+    for start in range(0, len(dirty), block):
+        chunk = dirty[start:start + block]
+        new_scores = (features[chunk] @ transposed).toarray().astype(np.float32).T  # n x chunk
+        new_scores[chunk, np.arange(len(chunk))] = -np.inf
+        new_ids = np.broadcast_to(chunk.astype(np.int32), new_scores.shape)
+        neighbors, scores = _select_top_k(np.hstack([neighbors, new_ids]),
+                                          np.hstack([scores, new_scores]), k)
+    # Guard against a row listing itself after padding
+    scores[neighbors == all_rows[:, None]] = -np.inf
+    return neighbors, scores, stale
+
+
+class SimilarityIndex:
+    """
+    Precomputed top-K similarity index over artists and users.
+
+    Args:
+        k: Neighbours kept per artist and per user
+        genre_weight: Weight of genre similarity in the artist score
+        cooccurrence_weight: Weight of listening co-occurrence in the artist score
+        rebuild_fraction: Rebuild everything when more than this fraction of
+            rows is dirty
+    """
+
+    def __init__(self, k=20, genre_weight=0.5, cooccurrence_weight=0.5, rebuild_fraction=0.2):
+        self.k = k
+        self.genre_weight = genre_weight
+        self.cooccurrence_weight = cooccurrence_weight
+        self.rebuild_fraction = rebuild_fraction
+
+        self.artist_ids = []
+        self.artist_rows = {}
+        self.artist_names = []
+        self.artist_genres = []  # row -> list of genre columns
+        self.artist_users = []   # row -> set of user rows
+
+        self.genres = {}
+        self.genre_df = []
+        self.idf = []  # recomputed on full rebuilds, kept in between
+
+        self.user_ids = []
+        self.user_rows = {}
+        self.user_counts = []    # row -> {artist row: plays}
+
+        self.artist_neighbors = np.zeros((0, k), dtype=np.int32)
+        self.artist_scores = np.zeros((0, k), dtype=np.float32)
+        self.user_neighbors = np.zeros((0, k), dtype=np.int32)
+        self.user_scores = np.zeros((0, k), dtype=np.float32)
+
+        self.dirty_artists = set()
+        self.dirty_users = set()
+        self.built = False
+
+    # Adding data
+
+    def _artist_row(self, artist_id, name=None):
+        row = self.artist_rows.get(artist_id)
+        if row is None:
+            row = self.artist_rows[artist_id] = len(self.artist_ids)
+            self.artist_ids.append(artist_id)
+            self.artist_names.append(name or artist_id)
+            self.artist_genres.append([])
+            self.artist_users.append(set())
+            self.dirty_artists.add(row)
+        elif name and self.artist_names[row] == artist_id:
+            self.artist_names[row] = name
+        return row
+
+    def _user_row(self, user_id):
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = self.user_rows[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.user_counts.append({})
+            self.dirty_users.add(row)
+        return row
+
+    def add_artists(self, artists):
+        """Add or update artists from full Spotify artist objects (with genres)."""
+        for artist in artists:
+            row = self._artist_row(artist['id'], artist.get('name'))
+            columns = []
+            for genre in artist.get('genres') or []:
+                column = self.genres.get(genre)
+                if column is None:
+                    column = self.genres[genre] = len(self.genre_df)
+                    self.genre_df.append(0)
+                    self.idf.append(None)
+                columns.append(column)
+            columns = sorted(set(columns))
+            if columns == self.artist_genres[row]:
+                continue
+            for column in self.artist_genres[row]:
+                self.genre_df[column] -= 1
+            for column in columns:
+                self.genre_df[column] += 1
+            self.artist_genres[row] = columns
+            self.dirty_artists.add(row)
+            # Listeners' genre profiles change too
+            self.dirty_users.update(self.artist_users[row])
+
+    def add_listening(self, user_id, artist_counts, names=None):
+        """
+        Add play counts for a user, e.g. ListeningStats windows or a Counter.
+
+        Args:
+            user_id: Any hashable user key
+            artist_counts: Mapping of artist ID to play count (replaces the
+                user's previous counts for those artists)
+            names: Optional mapping of artist ID to name
+        """
+        user = self._user_row(user_id)
+        counts = self.user_counts[user]
+        for artist_id, plays in artist_counts.items():
+            row = self._artist_row(artist_id, (names or {}).get(artist_id))
+            if counts.get(row) == plays:
+                continue
+            if plays > 0:
+                counts[row] = plays
+                self.artist_users[row].add(user)
+            else:
+                counts.pop(row, None)
+                self.artist_users[row].discard(user)
+            self.dirty_artists.add(row)
+            self.dirty_users.add(user)
+
+    def add_plays(self, user_id, plays):
+        """Count artist plays for a user from recently-played items or tracks."""
+        existing = self.user_counts[self.user_rows[user_id]] if user_id in self.user_rows else {}
+        counts = {self.artist_ids[row]: count for row, count in existing.items()}
+        names = {}
+        for play in plays:
+            track = play.get('track', play)
+            for artist in track['artists']:
+                counts[artist['id']] = counts.get(artist['id'], 0) + 1
+                names[artist['id']] = artist['name']
+        self.add_listening(user_id, counts, names)
+
+    # Feature matrices
+
+    def _genre_matrix(self, refresh_idf=False):
+        n_artists, n_genres = len(self.artist_ids), len(self.genre_df)
+        for column, idf in enumerate(self.idf):
+            if idf is None or refresh_idf:
+                self.idf[column] = float(np.log((1 + n_artists) / (1 + self.genre_df[column])) + 1)
+        rows = np.repeat(np.arange(n_artists), [len(g) for g in self.artist_genres])
+        columns = np.fromiter((c for g in self.artist_genres for c in g), dtype=np.int64, count=len(rows))
+        data = np.asarray(self.idf, dtype=np.float32)[columns] if len(columns) else np.zeros(0, np.float32)
+        return _normalize_rows(sp.csr_matrix((data, (rows, columns)), shape=(n_artists, n_genres)))
+
+    def _listening_matrix(self):
+        """Users x artists matrix of log-scaled play counts."""
+        rows = np.repeat(np.arange(len(self.user_ids)), [len(c) for c in self.user_counts])
+        columns = np.fromiter((a for c in self.user_counts for a in c), dtype=np.int64, count=len(rows))
+        plays = np.fromiter((n for c in self.user_counts for n in c.values()), dtype=np.float32, count=len(rows))
+        return sp.csr_matrix((np.log1p(plays), (rows, columns)),
+                             shape=(len(self.user_ids), len(self.artist_ids)))
+
+    def _features(self, refresh_idf=False):
+        """Normalized artist and user feature matrices."""
+        genres = self._genre_matrix(refresh_idf)
+        listening = self._listening_matrix()
+        artists = _normalize_rows(sp.hstack([
+            np.sqrt(self.genre_weight) * genres,
+            np.sqrt(self.cooccurrence_weight) * _normalize_rows(listening.T),
+        ]))
+        user_artists = _normalize_rows(listening)
+        users = _normalize_rows(sp.hstack([
+            np.sqrt(self.cooccurrence_weight) * user_artists,
+            np.sqrt(self.genre_weight) * _normalize_rows(user_artists @ genres),
+        ]))
+        return artists, users
+
+    # Building
+
+    def _refresh(self, features, neighbors, scores, dirty, full):
+        n = features.shape[0]
+        if full or not len(neighbors):
+            return top_k(features, np.arange(n), self.k)
+
+        # Grow the arrays for rows added since the last build
+        pad = n - len(neighbors)
+        if pad:
+            neighbors = np.vstack([neighbors, np.zeros((pad, self.k), dtype=np.int32)])
+            scores = np.vstack([scores, np.full((pad, self.k), -np.inf, dtype=np.float32)])
+        dirty = np.asarray(sorted(dirty), dtype=np.int64)
+        neighbors, scores, stale = merge_dirty(features, neighbors, scores, dirty)
+        recompute = np.union1d(dirty, stale)
+        neighbors[recompute], scores[recompute] = top_k(features, recompute, self.k)
+        return neighbors, scores
+
+    def update(self, full=False):
+        """
+        Bring the neighbour lists up to date with the data added so far.
+
+        Args:
+            full: Recompute every row, and the genre IDF weights, instead of
+                only the dirty rows
+        """
+        if not self.dirty_artists and not self.dirty_users and not full:
+            return
+        full = (full or not self.built
+                or len(self.dirty_artists) > self.rebuild_fraction * len(self.artist_ids))
+        # New IDF weights change every artist and user row, so only a full rebuild refreshes them
+        artists, users = self._features(refresh_idf=full)
+
+        self.artist_neighbors, self.artist_scores = self._refresh(
+            artists, self.artist_neighbors, self.artist_scores, self.dirty_artists, full)
+        full_users = full or len(self.dirty_users) > self.rebuild_fraction * len(self.user_ids)
+        self.user_neighbors, self.user_scores = self._refresh(
+            users, self.user_neighbors, self.user_scores, self.dirty_users, full_users)
+
+        self.dirty_artists.clear()
+        self.dirty_users.clear()
+        self.built = True
+
+    # Queries
+
+    def similar_artists(self, artist_id, n=10):
+        """Artists most similar to `artist_id` as (id, name, score) tuples."""
+        row = self.artist_rows.get(artist_id)
+        if row is None or row >= len(self.artist_neighbors):
+            return []
+        result = []
+        for neighbor, score in zip(self.artist_neighbors[row, :n], self.artist_scores[row, :n]):
+            if score <= 0:
+                break
+            result.append((self.artist_ids[neighbor], self.artist_names[neighbor], float(score)))
+        return result
+
+    def similar_users(self, user_id, n=10):
+        """Users with the most similar taste to `user_id` as (id, score) tuples."""
+        row = self.user_rows.get(user_id)
+        if row is None or row >= len(self.user_neighbors):
+            return []
+        result = []
+        for neighbor, score in zip(self.user_neighbors[row, :n], self.user_scores[row, :n]):
+            if score <= 0:
+                break
+            result.append((self.user_ids[neighbor], float(score)))
+        return result
+
+    # Persistence
+
+    def save(self, path):
+        """Save raw data and the built index to a compressed .npz file."""
+        self.update()
+        meta = {
+            'k': self.k,
+            'genre_weight': self.genre_weight,
+            'cooccurrence_weight': self.cooccurrence_weight,
+            'rebuild_fraction': self.rebuild_fraction,
+            'artist_ids': self.artist_ids,
+            'artist_names': self.artist_names,
+            'artist_genres': self.artist_genres,
+            'genres': sorted(self.genres, key=self.genres.get),
+            'idf': self.idf,
+            'user_ids': self.user_ids,
+            'user_counts': [sorted(counts.items()) for counts in self.user_counts],
+        }
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                artist_neighbors=self.artist_neighbors,
+                artist_scores=self.artist_scores,
+                user_neighbors=self.user_neighbors,
+                user_scores=self.user_scores,
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by `save()`."""
+        with np.load(path) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            index = cls(k=meta['k'], genre_weight=meta['genre_weight'],
+                        cooccurrence_weight=meta['cooccurrence_weight'],
+                        rebuild_fraction=meta['rebuild_fraction'])
+            index.artist_neighbors = data['artist_neighbors']
+            index.artist_scores = data['artist_scores']
+            index.user_neighbors = data['user_neighbors']
+            index.user_scores = data['user_scores']
+
+        index.artist_ids = meta['artist_ids']
+        index.artist_rows = {artist_id: row for row, artist_id in enumerate(index.artist_ids)}
+        index.artist_names = meta['artist_names']
+        index.artist_genres = meta['artist_genres']
+        index.genres = {genre: column for column, genre in enumerate(meta['genres'])}
+        index.idf = meta['idf']
+        index.genre_df = [0] * len(index.genres)
+        for columns in index.artist_genres:
+            for column in columns:
+                index.genre_df[column] += 1
+
+        index.user_ids = meta['user_ids']
+        index.user_rows = {user_id: row for row, user_id in enumerate(index.user_ids)}
+        index.user_counts = [dict(counts) for counts in meta['user_counts']]
+        index.artist_users = [set() for _ in index.artist_ids]
+        for user, counts in enumerate(index.user_counts):
+            for row in counts:
+                index.artist_users[row].add(user)
+        index.built = True
+        return index
@@ -10,16 +10,44 @@ Note: Due to Spotify API limitations, "total time listened" is approximated
 using Spotify's popularity-based rankings over long-term listening patterns.
 """
 
+import argparse
+import json
 import os
 import sys
-from dotenv import load_dotenv
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+import time
+
+# spotipy, requests and dotenv are imported on first use so that --help and
+# cached runs don't pay their import cost before printing anything
+
+SCOPE = "user-top-read user-read-recently-played"
+
+
+class MissingCredentialsError(RuntimeError):
+    """Raised when there are neither API credentials nor a usable cached token."""
 
 
 class SpotifyReader:
-    def __init__(self):
-        """Initialize the Spotify Reader with authentication."""
+    def __init__(self, cache_path=None, session=None, metadata_cache=None, token_margin=60,
+                 api_prefix=None):
+        """
+        Initialize the Spotify Reader with authentication.
+        
+        The Spotify client, HTTP session and metadata cache are built lazily on
+        first use. If the token cache holds an access token that is valid for
+        more than `token_margin` seconds it is reused directly, without
+        building the OAuth manager.
+        
+        Args:
+            cache_path: OAuth token cache file (spotipy's default if None)
+            session: ThrottledSession to share between readers
+            metadata_cache: MetadataCache to share between readers
+            token_margin: Seconds before expiry at which a token is refreshed
+            api_prefix: Web API base URL, e.g. a local fake_spotify server
+        
+        Raises:
+            MissingCredentialsError: No credentials and no valid cached token
+        """
+        from dotenv import load_dotenv
         load_dotenv()
         
         # Get credentials from environment variables
@@ -27,63 +55,237 @@ class SpotifyReader:
         self.client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
         self.redirect_uri = os.getenv('SPOTIPY_REDIRECT_URI', 'http://localhost:8080')
         
-        if not self.client_id or not self.client_secret:
-            print("❌ Error: Spotify API credentials not found!")
-            print("Please set up your .env file with your Spotify API credentials.")
-            print("See .env.example for the required format.")
-            sys.exit(1)
+        self.cache_path = cache_path
+        self.api_prefix = api_prefix or os.getenv('SPOTIFY_API_PREFIX')
+        self.token_margin = token_margin
+        self._session = session
+        self._metadata_cache = metadata_cache
+        self._auth_manager = None
+        self._sp = None
         
-        # Set up Spotify authentication
-        scope = "user-top-read user-read-recently-played"
+        # Credentials are only needed when there is no usable cached token
+        if (not self.client_id or not self.client_secret) and not self._valid_cached_token():
+            raise MissingCredentialsError("Spotify API credentials not found")
+    
+    @property
+    def session(self):
+        """Shared keep-alive session that paces requests and retries 429s."""
+        if self._session is None:
+            from transport import ThrottledSession
+            self._session = ThrottledSession(
+                rate=float(os.getenv('SPOTIFY_RATE_LIMIT', '10')),
+                max_per_host=int(os.getenv('SPOTIFY_MAX_CONNECTIONS', '8'))
+            )
+        return self._session
+    
+    @property
+    def metadata_cache(self):
+        """Local cache of full artist/track/album objects for enrichment."""
+        if self._metadata_cache is None:
+            from metadata import MetadataCache
+            self._metadata_cache = MetadataCache(
+                os.getenv('SPOTIFY_METADATA_CACHE', '.metadata_cache.json'))
+        return self._metadata_cache
+    
+    @property
+    def auth_manager(self):
+        """Full OAuth manager, only needed for logins and token refreshes."""
+        if self._auth_manager is None:
+            from spotipy.cache_handler import CacheFileHandler
+            from spotipy.oauth2 import SpotifyOAuth
+            self._auth_manager = SpotifyOAuth(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                redirect_uri=self.redirect_uri,
+                scope=SCOPE,
+                cache_handler=CacheFileHandler(cache_path=self.cache_path),
+                open_browser=self.cache_path is None,
+                requests_session=self.session
+            )
+        return self._auth_manager
+    
+    @property
+    def sp(self):
+        """Spotify client, built on first API call."""
+        if self._sp is None:
+            import spotipy
+            
+            # spotipy's own retry adapter is disabled so retries happen only
+            # in the shared session
+            token_info = self._valid_cached_token()
+            if token_info:
+                # Fast path: reuse the cached access token as-is
+                self._sp = spotipy.Spotify(auth=token_info['access_token'],
+                                           requests_session=self.session,
+                                           retries=0, status_retries=0)
+            else:
+                self._sp = spotipy.Spotify(auth_manager=self.auth_manager,
+                                           requests_session=self.session,
+                                           retries=0, status_retries=0)
+            if self.api_prefix:
+                self._sp.prefix = self.api_prefix
+        return self._sp
+    
+    def _read_cached_token(self):
+        """Read the token cache file directly, without importing spotipy."""
+        path = self.cache_path or '.cache'
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _valid_cached_token(self, margin=None):
+        """Return the cached token if it is valid for more than `margin` seconds."""
+        margin = self.token_margin if margin is None else margin
+        token_info = self._read_cached_token()
+        if (token_info and token_info.get('access_token')
+                and token_info.get('expires_at', 0) - time.time() > margin):
+            return token_info
+        return None
+    
+    def refresh_token_if_expiring(self, margin=300):
+        """
+        Refresh the cached access token if it expires within `margin` seconds.
         
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-            client_id=self.client_id,
-            client_secret=self.client_secret,
-            redirect_uri=self.redirect_uri,
-            scope=scope
-        ))
+        Returns:
+            True if a usable token is cached, False if the account still needs
+            an interactive login
+        """
+        token_info = self._read_cached_token()
+        if not token_info:
+            return False
+        if token_info['expires_at'] - time.time() < margin:
+            self.auth_manager.refresh_access_token(token_info['refresh_token'])
+            self._sp = None  # pick up the new token on next use
+        return True
         
-    def get_top_tracks(self, limit=10, time_range='long_term'):
+    def get_top_tracks(self, limit=10, time_range='long_term', raise_errors=False):
         """
         Get top tracks for the user.
         
         Args:
             limit: Number of tracks to return (max 50)
             time_range: 'short_term', 'medium_term', or 'long_term'
+            raise_errors: Raise request errors instead of returning None
         
         Returns:
-            List of track data
+            List of track data, or None if the request failed (e.g. still rate
+            limited after the transport's retries)
         """
         try:
             results = self.sp.current_user_top_tracks(limit=limit, time_range=time_range)
             return results['items']
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"❌ Error fetching top tracks: {e}")
-            return []
+            return None
     
-    def get_top_artists(self, limit=10, time_range='long_term'):
+    def get_top_artists(self, limit=10, time_range='long_term', raise_errors=False):
         """
         Get top artists for the user.
         
         Args:
             limit: Number of artists to return (max 50)
             time_range: 'short_term', 'medium_term', or 'long_term'
+            raise_errors: Raise request errors instead of returning None
         
         Returns:
-            List of artist data
+            List of artist data, or None if the request failed (e.g. still rate
+            limited after the transport's retries)
         """
         try:
             results = self.sp.current_user_top_artists(limit=limit, time_range=time_range)
             return results['items']
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"❌ Error fetching top artists: {e}")
-            return []
+            return None
+    
+    def get_recently_played(self, limit=50, after=None, raise_errors=False):
+        """
+        Get recently played tracks for the user.
+        
+        Args:
+            limit: Number of plays to return (max 50)
+            after: Only return plays after this Unix timestamp in milliseconds
+            raise_errors: Raise request errors instead of returning None
+        
+        Returns:
+            List of play data ({'track': ..., 'played_at': ...}), or None if
+            the request failed
+        """
+        try:
+            results = self.sp.current_user_recently_played(limit=limit, after=after)
+            return results['items']
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"❌ Error fetching recently played tracks: {e}")
+            return None
+    
+    def sync_listening_stats(self, path, raise_errors=False):
+        """
+        Fold plays since the last sync into the listening stats saved at `path`.
+        
+        Only plays newer than the stored cursor are requested, so each sync
+        costs time proportional to the number of new plays. If a request
+        fails, the plays folded in so far are kept and the sync stops there
+        (or the error is raised, with `raise_errors`).
+        
+        Returns:
+            Tuple of (ListeningStats, number of new plays)
+        """
+        from listening_stats import ListeningStats
+        
+        stats = ListeningStats.load(path)
+        new_plays = 0
+        try:
+            while True:
+                plays = self.get_recently_played(after=stats.cursor or None,
+                                                 raise_errors=raise_errors)
+                if plays is None:
+                    break
+                folded = stats.fold(plays)
+                new_plays += folded
+                if len(plays) < 50 or not folded:
+                    break
+        finally:
+            if new_plays:
+                stats.save(path)
+        return stats, new_plays
+    
+    def enrich_metadata(self, items):
+        """
+        Fetch full metadata for every artist, track and album in a dataset.
+        
+        Only IDs missing from the local metadata cache are requested, using
+        the batch endpoints in parallel.
+        
+        Args:
+            items: Tracks, artists or recently-played entries
+        
+        Returns:
+            Dict mapping 'artists', 'tracks' and 'albums' to {id: object}
+        """
+        from metadata import enrich
+        try:
+            return enrich(self.sp, items, cache=self.metadata_cache)
+        except Exception as e:
+            print(f"❌ Error fetching metadata: {e}")
+            return {'artists': {}, 'tracks': {}, 'albums': {}}
     
-    def format_tracks(self, tracks):
+    def format_tracks(self, tracks, metadata=None):
         """Format track data for display."""
+        if tracks is None:
+            return "❌ Top tracks could not be fetched."
         if not tracks:
             return "No tracks found."
         
+        artist_metadata = metadata['artists'] if metadata else {}
+        
         output = "\n🎵 TOP 10 SONGS OF ALL TIME\n"
         output += "=" * 50 + "\n"
         
@@ -96,12 +298,23 @@ class SpotifyReader:
             output += f"{i:2d}. {track_name}\n"
             output += f"    Artist(s): {artists}\n"
             output += f"    Album: {album}\n"
+            
+            genres = []
+            for artist in track['artists']:
+                for genre in artist_metadata.get(artist.get('id'), {}).get('genres', []):
+                    if genre not in genres:
+                        genres.append(genre)
+            if genres:
+                output += f"    Genres: {', '.join(genres[:3])}\n"
+            
             output += f"    Popularity: {popularity}/100\n\n"
         
         return output
     
     def format_artists(self, artists):
         """Format artist data for display."""
+        if artists is None:
+            return "❌ Top artists could not be fetched."
         if not artists:
             return "No artists found."
         
@@ -121,17 +334,94 @@ class SpotifyReader:
         
         return output
     
-    def get_user_profile(self):
-        """Get current user's profile information."""
+    def format_listening_stats(self, stats, limit=5):
+        """Format incremental listening stats for display."""
+        if not stats.cursor:
+            return "No listening history found."
+        
+        weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        busiest_hour = max(range(24), key=lambda hour: stats.hour_plays[hour])
+        busiest_day = max(range(7), key=lambda day: stats.weekday_plays[day])
+        streaks = stats.streaks()
+        
+        output = "\n📈 LISTENING STATS\n"
+        output += "=" * 50 + "\n"
+        output += f"Busiest hour: {busiest_hour:02d}:00 ({stats.hour_plays[busiest_hour]} plays)\n"
+        output += f"Busiest day: {weekdays[busiest_day]} ({stats.weekday_plays[busiest_day]} plays)\n"
+        output += f"Streak: {streaks['current']} day(s), longest {streaks['longest']} day(s)\n"
+        
+        for window in (7, 30):
+            top_artists = stats.top('artists', window, limit)
+            if top_artists:
+                output += f"\nTop artists, last {window} days:\n"
+                for i, (_, name, plays) in enumerate(top_artists, 1):
+                    output += f"{i:2d}. {name} ({plays} plays)\n"
+        
+        obsessions = stats.obsessions('tracks', limit=3)
+        if obsessions:
+            output += "\nCurrently obsessed with:\n"
+            for _, name, score in obsessions:
+                output += f"    {name} (score {score})\n"
+        
+        return output
+    
+    def build_report(self, limit=10, time_range='long_term'):
+        """
+        Collect a compact, JSON-serializable report of the user's top items.
+        
+        Request errors are raised rather than producing an empty report.
+        
+        Returns:
+            Dict with user, top_tracks and top_artists entries
+        """
+        user = self.get_user_profile(raise_errors=True)
+        return {
+            'user': {
+                'id': user.get('id'),
+                'display_name': user.get('display_name'),
+            },
+            'time_range': time_range,
+            'generated_at': int(time.time()),
+            'top_tracks': [
+                {
+                    'id': track['id'],
+                    'name': track['name'],
+                    'artists': [artist['name'] for artist in track['artists']],
+                    'album': track['album']['name'],
+                    'popularity': track['popularity'],
+                }
+                for track in self.get_top_tracks(limit, time_range, raise_errors=True)
+            ],
+            'top_artists': [
+                {
+                    'id': artist['id'],
+                    'name': artist['name'],
+                    'genres': artist['genres'],
+                    'followers': artist['followers']['total'],
+                    'popularity': artist['popularity'],
+                }
+                for artist in self.get_top_artists(limit, time_range, raise_errors=True)
+            ],
+        }
+    
+    def get_user_profile(self, raise_errors=False):
+        """Get current user's profile information (None if the request failed)."""
         try:
             user = self.sp.current_user()
             return user
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"❌ Error fetching user profile: {e}")
             return None
     
-    def run(self):
-        """Run the main Spotify Reader analysis."""
+    def run(self, stats_path=None):
+        """
+        Run the main Spotify Reader analysis.
+        
+        Args:
+            stats_path: Listening stats state file to sync and display, if any
+        """
         print("🎶 Spotify Reader - Analyzing Your Music Taste")
         print("=" * 50)
         
@@ -148,21 +438,64 @@ class SpotifyReader:
         top_tracks = self.get_top_tracks()
         top_artists = self.get_top_artists()
         
+        # Top artists are already full objects; seed the cache with them so
+        # only the remaining track artists and albums are requested
+        self.metadata_cache.update('artists', top_artists or [])
+        metadata = self.enrich_metadata(top_tracks or [])
+        
         # Display results
-        print(self.format_tracks(top_tracks))
+        print(self.format_tracks(top_tracks, metadata))
         print(self.format_artists(top_artists))
         
+        if stats_path:
+            listening_stats, new_plays = self.sync_listening_stats(stats_path)
+            print(f"🔄 Synced {new_plays} new play(s)")
+            print(self.format_listening_stats(listening_stats))
+        
+        stats = self.session.stats
+        if stats['retries']:
+            print(f"🔁 Retried {stats['retries']} request(s), "
+                  f"throttled for {stats['throttle_seconds']:.1f}s")
+        
         print("=" * 50)
         print("✨ Analysis complete!")
         print("\nNote: Rankings are based on Spotify's popularity algorithm")
         print("which considers your long-term listening patterns and preferences.")
 
 
-def main():
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Analyze your Spotify listening habits.")
+    parser.add_argument('--batch', metavar='TOKEN_DIR',
+                        help="generate reports for every cached OAuth token in TOKEN_DIR")
+    parser.add_argument('--output', metavar='PATH', default='reports',
+                        help="batch output: NDJSON file or directory of JSON files (default: reports)")
+    parser.add_argument('--format', choices=['json', 'ndjson'], default='ndjson',
+                        help="batch report format (default: ndjson)")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="accounts processed concurrently in batch mode (default: 4)")
+    parser.add_argument('--stats', metavar='PATH',
+                        help="sync incremental listening stats into PATH (a directory in batch mode)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main entry point for the Spotify Reader."""
+    args = parse_args(argv)
     try:
-        reader = SpotifyReader()
-        reader.run()
+        if args.batch:
+            from batch_report import run_batch
+            run_batch(args.batch, args.output, fmt=args.format, workers=args.workers,
+                      stats_dir=args.stats)
+        else:
+            reader = SpotifyReader()
+            reader.run(stats_path=args.stats)
+    except MissingCredentialsError:
+        print("❌ Error: Spotify API credentials not found!")
+        print("Please set up your .env file with your Spotify API credentials.")
+        print("See .env.example for the required format.")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\n\n👋 Goodbye!")
     except Exception as e:
@@ -0,0 +1,155 @@
+"""
+Rate-limit-aware HTTP transport for Spotify Reader
+
+Provides a requests.Session that spotipy can use in place of its default
+session. It keeps connections alive through a pooled adapter, paces requests
+with a client-side token bucket, caps concurrent requests per host and
+retries 429/5xx responses, honouring Retry-After with jittered exponential
+backoff. Counters for retries and throttle time are kept in `stats`.
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def block(self, seconds):
+        """Stop handing out tokens for `seconds` (e.g. after a 429)."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                else:
+                    delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ThrottledSession(requests.Session):
+    """
+    requests.Session with connection pooling, rate limiting and retries.
+
+    Args:
+        rate: Sustained requests per second across all threads
+        burst: Number of requests allowed in a burst
+        max_per_host: Maximum concurrent requests to a single host
+        max_retries: Retries for 429/5xx responses and connection errors
+        backoff_base: First backoff delay in seconds (doubled per attempt)
+        backoff_max: Upper bound for a single backoff delay
+        pool_size: Keep-alive connections kept per host
+    """
+
+    def __init__(self, rate=10.0, burst=20, max_per_host=8, max_retries=5,
+                 backoff_base=0.5, backoff_max=30.0, pool_size=16):
+        super().__init__()
+        self.bucket = TokenBucket(rate, burst)
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'retries': 0,
+            'throttled': 0,
+            'throttle_seconds': 0.0,
+            'limiter_wait_seconds': 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _host_slot(self, url):
+        """Return the semaphore limiting concurrency for the URL's host."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def _backoff(self, attempt, retry_after=None):
+        """Delay before the next attempt, preferring the server's Retry-After."""
+        if retry_after is not None:
+            # Small jitter so waiting threads don't all resume at once
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.1))
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)  # equal jitter
+
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def request(self, method, url, *args, **kwargs):
+        """Send a request, pacing and retrying it as needed."""
+        slot = self._host_slot(url)
+
+        for attempt in range(self.max_retries + 1):
+            self._count('limiter_wait_seconds', self.bucket.acquire())
+            self._count('requests')
+
+            try:
+                with slot:
+                    response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+
+                retry_after = self._retry_after(response)
+                delay = self._backoff(attempt, retry_after)
+                if response.status_code == 429:
+                    # The limit applies to the whole client, so pause every thread
+                    self.bucket.block(delay)
+                    self._count('throttled')
+                    self._count('throttle_seconds', delay)
+                response.close()
+
+            self._count('retries')
+            time.sleep(delay)